@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# Copyright: Vijay <http://t.me/Viiijay1>
+# License: GNU GPL, version 3 or later; http://www.gnu.org/copyleft/gpl.html
+"""
+Binary encoding of drawings, byte-compatible with web/ink_codec.js (see there
+for the layout).
+
+Strokes are dicts with tool, color, width, opacity, visible and points, a flat
+[x, y, pressure, width, ...] list. Coordinates and widths are quantized to
+1/SCALE of a pixel, pressures to hundredths, and the quantization rounds the
+same way as the JS side, so both encode a drawing to the same bytes.
+"""
+import math
+
+MAGIC = b"PD"
+VERSION = 1
+SCALE = 8
+TOOLS = ("pen", "highlighter", "eraser")
+VISIBLE = 1
+POINT_STRIDE = 4
+
+
+def quantize(value, scale):
+    return math.floor(value * scale + 0.5)
+
+
+def _write_varint(out, value):
+    while value >= 128:
+        out.append(value % 128 + 128)
+        value //= 128
+    out.append(value)
+
+
+def _write_signed(out, value):
+    _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+
+
+def _write_runs(out, values):
+    i = 0
+    count = len(values)
+    while i < count:
+        j = i + 1
+        while j < count and values[j] == values[i]:
+            j += 1
+        _write_varint(out, j - i)
+        _write_varint(out, values[i])
+        i = j
+
+
+def encode_drawing(strokes):
+    """
+    Encode a list of strokes to bytes.
+    """
+    colors = {}
+    for stroke in strokes:
+        colors.setdefault(stroke["color"], len(colors))
+    out = bytearray(MAGIC)
+    _write_varint(out, VERSION)
+    _write_varint(out, SCALE)
+    _write_varint(out, len(colors))
+    for color in colors:
+        text = color.encode("utf-8")
+        _write_varint(out, len(text))
+        out += text
+    _write_varint(out, len(strokes))
+    for stroke in strokes:
+        points = stroke["points"]
+        count = len(points) // POINT_STRIDE
+        _write_varint(out, TOOLS.index(stroke["tool"]) if stroke["tool"] in TOOLS else 0)
+        _write_varint(out, VISIBLE if stroke.get("visible", True) else 0)
+        _write_varint(out, colors[stroke["color"]])
+        _write_varint(out, min(255, max(0, quantize(stroke["opacity"], 255))))
+        _write_varint(out, max(0, quantize(stroke["width"], SCALE)))
+        _write_varint(out, count)
+        x = y = 0
+        for i in range(0, count * POINT_STRIDE, POINT_STRIDE):
+            qx = quantize(points[i], SCALE)
+            qy = quantize(points[i + 1], SCALE)
+            _write_signed(out, qx - x)
+            _write_signed(out, qy - y)
+            x, y = qx, qy
+        _write_runs(out, [max(0, quantize(points[i + 2], 100))
+                          for i in range(0, count * POINT_STRIDE, POINT_STRIDE)])
+        _write_runs(out, [max(0, quantize(points[i + 3], SCALE))
+                          for i in range(0, count * POINT_STRIDE, POINT_STRIDE)])
+    return bytes(out)
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def varint(self):
+        value = 0
+        shift = 0
+        while True:
+            if self.offset >= len(self.data):
+                raise ValueError("Truncated drawing")
+            byte = self.data[self.offset]
+            self.offset += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 128:
+                return value
+
+    def signed(self):
+        value = self.varint()
+        return -(value + 1) // 2 if value & 1 else value // 2
+
+    def runs(self, count):
+        values = []
+        while len(values) < count:
+            run = self.varint()
+            value = self.varint()
+            if run == 0:
+                raise ValueError("Empty run in drawing")
+            values.extend([value] * min(run, count - len(values)))
+        return values
+
+    def entry(self, table, what):
+        index = self.varint()
+        if index >= len(table):
+            raise ValueError("Unknown %s %d in drawing" % (what, index))
+        return table[index]
+
+    def point_count(self):
+        # Every point takes at least two bytes (its x and y deltas), so a
+        # count the rest of the data cannot hold is rejected before anything
+        # is allocated for it.
+        count = self.varint()
+        if count * 2 > len(self.data) - self.offset:
+            raise ValueError("Truncated drawing")
+        return count
+
+
+def _read_header(reader):
+    if reader.data[:2] != MAGIC:
+        raise ValueError("Not a drawing")
+    reader.offset = 2
+    version = reader.varint()
+    if version != VERSION:
+        raise ValueError("Unknown drawing version %d" % version)
+    scale = reader.varint()
+    if scale == 0:
+        raise ValueError("Drawing has no coordinate scale")
+    colors = []
+    for _ in range(reader.varint()):
+        length = reader.varint()
+        if reader.offset + length > len(reader.data):
+            raise ValueError("Truncated drawing")
+        colors.append(bytes(reader.data[reader.offset:reader.offset + length]).decode("utf-8"))
+        reader.offset += length
+    return scale, colors
+
+
+def decode_drawing(data):
+    """
+    Decode bytes from encode_drawing() (either side) to a list of strokes.
+    """
+    reader = _Reader(data)
+    scale, colors = _read_header(reader)
+    strokes = []
+    for _ in range(reader.varint()):
+        stroke = {
+            "tool": reader.entry(TOOLS, "tool"),
+            "visible": bool(reader.varint() & VISIBLE),
+            "color": reader.entry(colors, "color"),
+            "opacity": reader.varint() / 255,
+            "width": reader.varint() / scale,
+        }
+        count = reader.point_count()
+        points = [0.0] * (count * POINT_STRIDE)
+        x = y = 0
+        for i in range(0, count * POINT_STRIDE, POINT_STRIDE):
+            x += reader.signed()
+            y += reader.signed()
+            points[i] = x / scale
+            points[i + 1] = y / scale
+        for i, value in enumerate(reader.runs(count)):
+            points[i * POINT_STRIDE + 2] = value / 100
+        for i, value in enumerate(reader.runs(count)):
+            points[i * POINT_STRIDE + 3] = value / scale
+        stroke["points"] = points
+        strokes.append(stroke)
+    return strokes
+
+
+def stroke_count(data):
+    """
+    Number of strokes in an encoded drawing, reading only its header.
+    """
+    reader = _Reader(data)
+    _read_header(reader)
+    return reader.varint()
+
+
+def drawing_summary(data):
+    """
+    (stroke count, extent) of an encoded drawing, counting the visible pen and
+    highlighter strokes. The extent is (min_x, min_y, max_x, max_y) of their
+    ink including the pen width, or None if there is none. Scans the bytes
+    without building the strokes.
+    """
+    reader = _Reader(data)
+    scale, colors = _read_header(reader)
+    count = 0
+    extent = None
+    for _ in range(reader.varint()):
+        tool = reader.entry(TOOLS, "tool")
+        visible = reader.varint() & VISIBLE
+        reader.entry(colors, "color")
+        reader.varint()
+        reader.varint()
+        points = reader.point_count()
+        x = y = 0
+        min_x = min_y = max_x = max_y = None
+        for _ in range(points):
+            x += reader.signed()
+            y += reader.signed()
+            if min_x is None:
+                min_x = max_x = x
+                min_y = max_y = y
+            else:
+                min_x, max_x = min(min_x, x), max(max_x, x)
+                min_y, max_y = min(min_y, y), max(max_y, y)
+        reader.runs(points)
+        widths = reader.runs(points)
+        if not visible or tool == "eraser" or not points:
+            continue
+        count += 1
+        r = max(widths) / 2
+        box = ((min_x - r) / scale, (min_y - r) / scale, (max_x + r) / scale, (max_y + r) / scale)
+        if extent is None:
+            extent = box
+        else:
+            extent = (min(extent[0], box[0]), min(extent[1], box[1]),
+                      max(extent[2], box[2]), max(extent[3], box[3]))
+    return count, extent
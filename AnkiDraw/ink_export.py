@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# Copyright: Vijay <http://t.me/Viiijay1>
+# License: GNU GPL, version 3 or later; http://www.gnu.org/copyleft/gpl.html
+"""
+Export of a card's drawing as an image file.
+
+Works on the drawing as the reviewer page exports it (a list of strokes with
+tool, color, opacity and flat [x, y, pressure, width] points) and builds the
+same outline the page fills committed strokes with (build_stroke_path() in
+web/geometry.js): trapezoids between the flattened curve points plus a disc at
+every joint. SVG is plain text; PNG is painted with QPainter onto a QImage,
+which is safe off the main thread. Both are meant to run in the background;
+the file is then added to the collection's media on the main thread.
+"""
+import hashlib
+import math
+
+POINT_STRIDE = 4
+EXPORT_MARGIN = 8
+PNG_SCALE = 2
+FILE_PREFIX = "pendown-"
+
+
+def flatten_stroke(points):
+    """
+    Flatten the quadratic curves through the sample midpoints into
+    (x, y, width) triples, like flatten_stroke() in geometry.js.
+    """
+    count = len(points) // POINT_STRIDE
+    line = [(points[0], points[1], points[3])]
+    for j in range(1, count):
+        p1 = max(j - 2, 0) * POINT_STRIDE
+        p2 = (j - 1) * POINT_STRIDE
+        p3 = j * POINT_STRIDE
+        sx, sy = (points[p1] + points[p2]) / 2, (points[p1 + 1] + points[p2 + 1]) / 2
+        ex, ey = (points[p2] + points[p3]) / 2, (points[p2 + 1] + points[p3 + 1]) / 2
+        sw = line[-1][2]
+        length = (math.hypot(points[p2] - sx, points[p2 + 1] - sy) +
+                  math.hypot(ex - points[p2], ey - points[p2 + 1]))
+        steps = max(1, min(8, math.ceil(length / 4)))
+        for k in range(1, steps + 1):
+            t = k / steps
+            u = 1 - t
+            line.append((u * u * sx + 2 * u * t * points[p2] + t * t * ex,
+                         u * u * sy + 2 * u * t * points[p2 + 1] + t * t * ey,
+                         sw + t * (points[p3 + 3] - sw)))
+    last = (count - 1) * POINT_STRIDE
+    line.append((points[last], points[last + 1], points[last + 3]))
+    return line
+
+
+def stroke_outline(stroke):
+    """
+    Yield the sub-paths of a stroke's outline: ("disc", x, y, r) and
+    ("quad", ((x, y), (x, y), (x, y), (x, y))). All wind the same way, so a
+    nonzero fill paints overlaps once.
+    """
+    line = flatten_stroke(stroke["points"])
+    round_caps = stroke["tool"] != "highlighter"
+    for i, (x0, y0, w0) in enumerate(line):
+        r0 = w0 / 2
+        if round_caps or 0 < i < len(line) - 1:
+            yield ("disc", x0, y0, r0)
+        if i + 1 >= len(line):
+            break
+        x1, y1, w1 = line[i + 1]
+        r1 = w1 / 2
+        length = math.hypot(x1 - x0, y1 - y0)
+        if length == 0:
+            continue
+        nx, ny = -(y1 - y0) / length, (x1 - x0) / length
+        yield ("quad", ((x0 - nx * r0, y0 - ny * r0), (x1 - nx * r1, y1 - ny * r1),
+                        (x1 + nx * r1, y1 + ny * r1), (x0 + nx * r0, y0 + ny * r0)))
+
+
+def drawable_strokes(strokes):
+    """
+    The strokes that leave ink, highlighter first since the page shows its
+    layer below the pen layer.
+    """
+    strokes = [stroke for stroke in strokes
+               if stroke.get("tool") in ("pen", "highlighter") and len(stroke["points"]) >= POINT_STRIDE]
+    return sorted(strokes, key=lambda stroke: stroke["tool"] != "highlighter")
+
+
+def drawing_bounds(strokes):
+    """
+    (min_x, min_y, max_x, max_y) of the ink, including the pen width and a
+    margin, or None for an empty drawing.
+    """
+    bounds = None
+    for stroke in strokes:
+        points = stroke["points"]
+        for i in range(0, len(points) - POINT_STRIDE + 1, POINT_STRIDE):
+            r = points[i + 3] / 2 + EXPORT_MARGIN
+            box = (points[i] - r, points[i + 1] - r, points[i] + r, points[i + 1] + r)
+            if bounds is None:
+                bounds = box
+            else:
+                bounds = (min(bounds[0], box[0]), min(bounds[1], box[1]),
+                          max(bounds[2], box[2]), max(bounds[3], box[3]))
+    return bounds
+
+
+def split_color(color):
+    """
+    Split a CSS hex color into "#rrggbb" and its alpha (0-1). Colors that are
+    not hex are passed through with alpha 1.
+    """
+    if color.startswith("#") and len(color) in (5, 9):
+        digits = len(color) // 4 * 3
+        alpha = int(color[digits + 1:] * (2 if len(color) == 5 else 1), 16) / 255
+        return color[:digits + 1], alpha
+    return color, 1.0
+
+
+def _number(value):
+    text = ("%.2f" % value).rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def drawing_to_svg(strokes):
+    """
+    Serialize a drawing to SVG text, cropped to its ink. Returns None for an
+    empty drawing.
+    """
+    strokes = drawable_strokes(strokes)
+    bounds = drawing_bounds(strokes)
+    if bounds is None:
+        return None
+    min_x, min_y, max_x, max_y = bounds
+    out = ['<svg xmlns="http://www.w3.org/2000/svg" width="%s" height="%s" viewBox="%s %s %s %s">'
+           % (_number(max_x - min_x), _number(max_y - min_y),
+              _number(min_x), _number(min_y), _number(max_x - min_x), _number(max_y - min_y))]
+    for stroke in strokes:
+        data = []
+        for part in stroke_outline(stroke):
+            if part[0] == "disc":
+                _, x, y, r = part
+                # Two half arcs, clockwise like the canvas arc() they mirror.
+                data.append("M%s %sA%s %s 0 1 1 %s %sA%s %s 0 1 1 %s %sZ" % (
+                    _number(x + r), _number(y), _number(r), _number(r), _number(x - r), _number(y),
+                    _number(r), _number(r), _number(x + r), _number(y)))
+            else:
+                corners = part[1]
+                data.append("M" + "L".join("%s %s" % (_number(x), _number(y)) for x, y in corners) + "Z")
+        color, alpha = split_color(stroke["color"])
+        out.append('<path fill="%s" fill-opacity="%s" d="%s"/>'
+                   % (color, _number(alpha * stroke.get("opacity", 1)), "".join(data)))
+    out.append("</svg>")
+    return "\n".join(out)
+
+
+def drawing_to_png(strokes, scale=PNG_SCALE):
+    """
+    Paint a drawing onto a transparent image, cropped to its ink, and return
+    the PNG bytes. Returns None for an empty drawing.
+    """
+    from aqt.qt import QBuffer, QByteArray, QColor, QImage, QPainter, QPainterPath, QRectF, Qt
+
+    strokes = drawable_strokes(strokes)
+    bounds = drawing_bounds(strokes)
+    if bounds is None:
+        return None
+    min_x, min_y, max_x, max_y = bounds
+    image = QImage(max(1, math.ceil((max_x - min_x) * scale)), max(1, math.ceil((max_y - min_y) * scale)),
+                   QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(Qt.GlobalColor.transparent)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.setPen(Qt.PenStyle.NoPen)
+    painter.scale(scale, scale)
+    painter.translate(-min_x, -min_y)
+    for stroke in strokes:
+        path = QPainterPath()
+        path.setFillRule(Qt.FillRule.WindingFill)
+        for part in stroke_outline(stroke):
+            if part[0] == "disc":
+                _, x, y, r = part
+                path.moveTo(x + r, y)
+                # Qt's angles run counter-clockwise, the canvas' clockwise.
+                path.arcTo(QRectF(x - r, y - r, 2 * r, 2 * r), 0, -360)
+                path.closeSubpath()
+            else:
+                corners = part[1]
+                path.moveTo(*corners[0])
+                for x, y in corners[1:]:
+                    path.lineTo(x, y)
+                path.closeSubpath()
+        color, alpha = split_color(stroke["color"])
+        painter.setOpacity(alpha * stroke.get("opacity", 1))
+        painter.fillPath(path, QColor(color))
+    painter.end()
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QBuffer.OpenModeFlag.WriteOnly)
+    image.save(buffer, "PNG")
+    buffer.close()
+    return bytes(data)
+
+
+def export_drawing(strokes, image_format):
+    """
+    Encode a drawing as an image file. Returns (file name, data), with the
+    name derived from the content, or None for an empty drawing. The data is
+    meant for the collection's media.write_data(), which keeps one file for
+    identical exports and returns the name it was stored under.
+    """
+    if image_format == "svg":
+        text = drawing_to_svg(strokes)
+        data = text.encode("utf-8") if text is not None else None
+    else:
+        data = drawing_to_png(strokes)
+    if data is None:
+        return None
+    return "%s%s.%s" % (FILE_PREFIX, hashlib.sha1(data).hexdigest(), image_format), data
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# Copyright: Vijay <http://t.me/Viiijay1>
+# License: GNU GPL, version 3 or later; http://www.gnu.org/copyleft/gpl.html
+"""
+Per-card storage of drawings.
+
+Drawings arrive from the reviewer page in the binary form of ink_codec.py and
+are kept in an SQLite file in the profile folder, one row per card. save()
+only checks a drawing's header and queues it in memory; flush() reads every
+queued drawing through, drops those it cannot, and writes the rest in a single
+transaction. It is meant to run on a background thread, so the reviewer never
+waits on the disk or on a scan of a large drawing.
+
+Next to each drawing the row keeps its stroke count and ink extent, written
+by flush() from a scan of the encoded bytes, so searches like "cards with
+more than 50 strokes" run on an index and never decode a drawing.
+"""
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from .ink_codec import drawing_summary, encode_drawing as encode_strokes, stroke_count
+
+FORMAT_JSON_ZLIB = 1
+FORMAT_INK_CODEC = 2
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS drawings (
+    cid INTEGER PRIMARY KEY,
+    mtime INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    strokes INTEGER NOT NULL DEFAULT 0,
+    min_x REAL,
+    min_y REAL,
+    max_x REAL,
+    max_y REAL
+);
+"""
+
+INDEX_COLUMNS = (
+    ("strokes", "INTEGER NOT NULL DEFAULT 0"),
+    ("min_x", "REAL"),
+    ("min_y", "REAL"),
+    ("max_x", "REAL"),
+    ("max_y", "REAL"),
+)
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS drawings_strokes ON drawings (strokes);
+"""
+
+COMPARISONS = {"<", "<=", "=", ">", ">="}
+
+
+def encode_drawing(payload):
+    """
+    Pack an encoded drawing into the on-disk blob.
+    """
+    return bytes([FORMAT_INK_CODEC]) + payload
+
+
+def decode_drawing(blob):
+    """
+    Unpack an on-disk blob back into an encoded drawing. Rows written before
+    the binary format (zlib-compressed JSON) are converted. Raises ValueError
+    for a blob that cannot be read.
+    """
+    if not blob:
+        raise ValueError("Empty drawing blob")
+    if blob[0] == FORMAT_INK_CODEC:
+        return bytes(blob[1:])
+    if blob[0] == FORMAT_JSON_ZLIB:
+        try:
+            return encode_strokes(json.loads(zlib.decompress(blob[1:]).decode("utf-8")))
+        except (zlib.error, KeyError, TypeError, AttributeError) as error:
+            raise ValueError("Unreadable drawing: %s" % error) from error
+    raise ValueError("Unknown drawing format %d" % blob[0])
+
+
+def index_values(payload):
+    """
+    The index columns of a drawing: stroke count and min/max x/y.
+    """
+    strokes, extent = drawing_summary(payload)
+    return (strokes,) + (extent or (None, None, None, None))
+
+
+class InkStore:
+    def __init__(self, path):
+        self.path = path
+        self._pending = {}
+        self._flushing = {}
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._reader = self._connect()
+        with self._reader:
+            self._reader.execute("PRAGMA journal_mode=WAL")
+            self._reader.executescript(SCHEMA)
+            self._migrate()
+            self._reader.executescript(INDEXES)
+
+    def _migrate(self):
+        """
+        Bring a database from an older version up to date. Version 0 had no
+        index columns; they are added and filled once from the drawings.
+        """
+        version = self._reader.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        columns = {row[1] for row in self._reader.execute("PRAGMA table_info(drawings)")}
+        for name, definition in INDEX_COLUMNS:
+            if name not in columns:
+                self._reader.execute("ALTER TABLE drawings ADD COLUMN %s %s" % (name, definition))
+        for card_id, blob in self._reader.execute("SELECT cid, data FROM drawings").fetchall():
+            try:
+                values = index_values(decode_drawing(blob))
+            except ValueError:
+                # Left at strokes = 0: kept, but never found by a search.
+                continue
+            self._reader.execute(
+                "UPDATE drawings SET strokes = ?, min_x = ?, min_y = ?, max_x = ?, max_y = ? WHERE cid = ?",
+                values + (card_id,))
+        self._reader.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def save(self, card_id, payload):
+        """
+        Queue the drawing of a card. An empty drawing removes the card's row.
+        Raises ValueError if payload does not start like an encoded drawing;
+        the rest is checked by flush().
+        """
+        stroke_count(payload)
+        with self._pending_lock:
+            self._pending[card_id] = payload
+
+    def has_pending(self):
+        with self._pending_lock:
+            return bool(self._pending)
+
+    def load(self, card_id):
+        """
+        Return the encoded drawing of a card, or None if it has none or it
+        cannot be read. Queued drawings win over what is already on disk.
+        Whether there is anything to show comes from the header of a queued
+        drawing and from the index for a saved one.
+        """
+        with self._pending_lock:
+            payload = self._pending.get(card_id, self._flushing.get(card_id))
+        try:
+            if payload is not None:
+                return payload if stroke_count(payload) else None
+            row = self._reader.execute(
+                "SELECT data, strokes FROM drawings WHERE cid = ?", (card_id,)).fetchone()
+            if row is None or not row[1]:
+                return None
+            return decode_drawing(row[0])
+        except ValueError:
+            return None
+
+    def flush(self):
+        """
+        Write all queued drawings in one transaction.
+        """
+        with self._write_lock:
+            with self._pending_lock:
+                self._flushing, self._pending = self._pending, {}
+                batch = dict(self._flushing)
+            if not batch:
+                return
+            # save() only checks the header; a drawing that cannot be read
+            # is dropped here rather than failing (and retrying) the batch.
+            rows = {}
+            for card_id, payload in batch.items():
+                try:
+                    rows[card_id] = (payload, index_values(payload))
+                except ValueError:
+                    pass
+            now = int(time.time())
+            conn = self._connect()
+            try:
+                with conn:
+                    for card_id, (payload, values) in rows.items():
+                        if not values[0]:
+                            conn.execute("DELETE FROM drawings WHERE cid = ?", (card_id,))
+                        else:
+                            conn.execute(
+                                "INSERT OR REPLACE INTO drawings"
+                                " (cid, mtime, data, strokes, min_x, min_y, max_x, max_y)"
+                                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                (card_id, now, encode_drawing(payload)) + values)
+            except Exception:
+                # Put the batch back so the next flush retries it, unless the
+                # card has been drawn on again in the meantime.
+                with self._pending_lock:
+                    for card_id, (payload, _) in rows.items():
+                        self._pending.setdefault(card_id, payload)
+                raise
+            finally:
+                conn.close()
+                with self._pending_lock:
+                    self._flushing = {}
+
+    def info(self, card_id):
+        """
+        Return (stroke count, extent, mtime) of a card's saved drawing from
+        the index, or None if it has none. Queued drawings are not included.
+        """
+        row = self._reader.execute(
+            "SELECT strokes, min_x, min_y, max_x, max_y, mtime FROM drawings WHERE cid = ?",
+            (card_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], (row[1:5] if row[1] is not None else None), row[5]
+
+    def search(self, comparison, count):
+        """
+        Return the ids of the cards with a drawing whose stroke count compares
+        to count as given ("<", "<=", "=", ">" or ">="), comma-separated as a
+        cid: search wants them. Cards without a drawing are never returned,
+        even when 0 would match. The answer comes from the index, with the
+        stroke counts of queued drawings (read from their headers) in place
+        of their cards' rows; nothing is written.
+        """
+        if comparison not in COMPARISONS:
+            raise ValueError("Unknown comparison %r" % comparison)
+        with self._pending_lock:
+            queued = dict(self._flushing)
+            queued.update(self._pending)
+        counts = {}
+        for card_id, payload in queued.items():
+            try:
+                counts[card_id] = stroke_count(payload)
+            except ValueError:
+                pass
+        row = self._reader.execute(
+            "SELECT group_concat(cid) FROM drawings WHERE strokes > 0 AND strokes %s ?" % comparison,
+            (count,)).fetchone()
+        if not counts:
+            return row[0] or ""
+        # Queued cards whose saved row matched are taken out again; those
+        # whose queued drawing matches are added.
+        queued = json.dumps(counts)
+        stale = {card_id for (card_id,) in self._reader.execute(
+            "SELECT cid FROM drawings WHERE cid IN (SELECT CAST(key AS INTEGER) FROM json_each(?1))"
+            " AND strokes > 0 AND strokes %s ?2" % comparison, (queued, count))}
+        saved = row[0] or ""
+        if stale:
+            saved = ",".join(card_id for card_id in saved.split(",") if int(card_id) not in stale)
+        matched = self._reader.execute(
+            "SELECT group_concat(key) FROM json_each(?1) WHERE value > 0 AND value %s ?2" % comparison,
+            (queued, count)).fetchone()[0]
+        return ",".join(ids for ids in (saved, matched) if ids)
+
+    def close(self):
+        """
+        Write whatever is still queued and release the database.
+        """
+        self.flush()
+        self._reader.close()
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+# Copyright: Vijay <http://t.me/Viiijay1>
+# License: GNU GPL, version 3 or later; http://www.gnu.org/copyleft/gpl.html
+"""
+Pure-Python reference of the reviewer page's stroke model.
+
+Mirrors strokes_data in web/pendown.js closely enough to measure and check the
+drawing logic without a webview or Anki: strokes are pushed and grow point by
+point, a finished eraser stroke hides every earlier visible stroke it passes
+over (the whole-stroke eraser, with the reach test of doesSegmentHitEraser()
+in web/geometry.js; the page erases live, batch by batch of samples, which
+hides the same strokes), and undo/redo move strokes between the stroke list
+and the redo stack, an eraser taking its erased_indices along.
+
+Hit-testing has two backends: "grid", the uniform segment grid the page uses,
+and "numpy", which tests every eraser segment against all candidate segments
+at once. NumPy is optional; only the "numpy" backend needs it. Nothing here
+imports aqt, so the module can be loaded on its own (see
+benchmarks/bench_stroke_engine.py).
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+GRID_CELL_SIZE = 64
+ERASER_WIDTH = 20
+BACKENDS = ("grid", "numpy")
+
+
+class Stroke:
+    __slots__ = ("tool", "color", "width", "opacity", "points", "visible", "erased_indices", "grid_cells",
+                 "array", "box")
+
+    def __init__(self, tool, color, width, opacity):
+        self.tool = tool
+        self.color = color
+        self.width = width
+        self.opacity = opacity
+        self.points = [] # (x, y, pressure, width) samples
+        self.visible = True
+        self.erased_indices = None
+        self.grid_cells = None
+        self.array = None
+        self.box = None
+
+
+def do_line_segments_intersect(x0, y0, x1, y1, x2, y2, x3, y3):
+    """
+    doLineSegmentsIntersect() of geometry.js: true if the closed segments
+    cross. Parallel segments never do (the division yields inf or nan).
+    """
+    s1_x, s1_y = x1 - x0, y1 - y0
+    s2_x, s2_y = x3 - x2, y3 - y2
+    denominator = -s2_x * s1_y + s1_x * s2_y
+    if denominator == 0:
+        return False
+    s = (-s1_y * (x0 - x2) + s1_x * (y0 - y2)) / denominator
+    t = (s2_x * (y0 - y2) - s2_y * (x0 - x2)) / denominator
+    return 0 <= s <= 1 and 0 <= t <= 1
+
+
+def point_segment_distance_sq(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    len_sq = dx * dx + dy * dy
+    t = 0
+    if len_sq > 0:
+        t = max(0, min(1, ((px - ax) * dx + (py - ay) * dy) / len_sq))
+    ex, ey = ax + t * dx - px, ay + t * dy - py
+    return ex * ex + ey * ey
+
+
+def segment_distance_sq(x0, y0, x1, y1, x2, y2, x3, y3):
+    if do_line_segments_intersect(x0, y0, x1, y1, x2, y2, x3, y3):
+        return 0
+    return min(point_segment_distance_sq(x0, y0, x2, y2, x3, y3),
+               point_segment_distance_sq(x1, y1, x2, y2, x3, y3),
+               point_segment_distance_sq(x2, y2, x0, y0, x1, y1),
+               point_segment_distance_sq(x3, y3, x0, y0, x1, y1))
+
+
+def stroke_segments(points):
+    """
+    (index, a, b) for every segment of a stroke; a single sample is one
+    degenerate segment, as in for_each_segment().
+    """
+    if len(points) == 1:
+        return [(0, points[0], points[0])]
+    return [(i, points[i], points[i + 1]) for i in range(len(points) - 1)]
+
+
+def grid_cells(min_x, min_y, max_x, max_y):
+    for cx in range(math.floor(min_x / GRID_CELL_SIZE), math.floor(max_x / GRID_CELL_SIZE) + 1):
+        for cy in range(math.floor(min_y / GRID_CELL_SIZE), math.floor(max_y / GRID_CELL_SIZE) + 1):
+            yield cx, cy
+
+
+class SegmentGrid:
+    """
+    The segment grid of geometry.js: cell -> list of (stroke, segment index).
+    """
+
+    def __init__(self):
+        self.cells = {}
+
+    def add(self, stroke):
+        keys = set()
+        for i, a, b in stroke_segments(stroke.points):
+            half_width = max(a[3], b[3]) / 2
+            for key in grid_cells(min(a[0], b[0]) - half_width, min(a[1], b[1]) - half_width,
+                                  max(a[0], b[0]) + half_width, max(a[1], b[1]) + half_width):
+                self.cells.setdefault(key, []).append((stroke, i))
+                keys.add(key)
+        stroke.grid_cells = keys
+
+    def remove(self, stroke):
+        for key in stroke.grid_cells or ():
+            kept = [entry for entry in self.cells.get(key, ()) if entry[0] is not stroke]
+            if kept:
+                self.cells[key] = kept
+            else:
+                self.cells.pop(key, None)
+        stroke.grid_cells = None
+
+    def clear(self):
+        self.cells.clear()
+
+    def find_erased(self, eraser):
+        """
+        The visible strokes the eraser stroke passes over.
+        """
+        hits = set()
+        half = eraser.width / 2
+        for _, (ex0, ey0, _p0, _w0), (ex1, ey1, _p1, _w1) in stroke_segments(eraser.points):
+            for key in grid_cells(min(ex0, ex1) - half, min(ey0, ey1) - half,
+                                  max(ex0, ex1) + half, max(ey0, ey1) + half):
+                for stroke, i in self.cells.get(key, ()):
+                    if not stroke.visible or id(stroke) in hits:
+                        continue
+                    a = stroke.points[i]
+                    b = stroke.points[min(i + 1, len(stroke.points) - 1)]
+                    reach = half + max(a[3], b[3]) / 2
+                    if segment_distance_sq(a[0], a[1], b[0], b[1], ex0, ey0, ex1, ey1) <= reach * reach:
+                        hits.add(id(stroke))
+        return hits
+
+
+def _point_segment_distance_sq_np(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    len_sq = dx * dx + dy * dy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(len_sq > 0, ((px - ax) * dx + (py - ay) * dy) / len_sq, 0)
+    t = np.clip(t, 0, 1)
+    ex, ey = ax + t * dx - px, ay + t * dy - py
+    return ex * ex + ey * ey
+
+
+def segment_distance_sq_np(x0, y0, x1, y1, x2, y2, x3, y3):
+    """
+    segment_distance_sq() over broadcast arrays.
+    """
+    s1_x, s1_y = x1 - x0, y1 - y0
+    s2_x, s2_y = x3 - x2, y3 - y2
+    denominator = -s2_x * s1_y + s1_x * s2_y
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = (-s1_y * (x0 - x2) + s1_x * (y0 - y2)) / denominator
+        t = (s2_x * (y0 - y2) - s2_y * (x0 - x2)) / denominator
+    crossing = (s >= 0) & (s <= 1) & (t >= 0) & (t <= 1)
+    distance = np.minimum(
+        np.minimum(_point_segment_distance_sq_np(x0, y0, x2, y2, x3, y3),
+                   _point_segment_distance_sq_np(x1, y1, x2, y2, x3, y3)),
+        np.minimum(_point_segment_distance_sq_np(x2, y2, x0, y0, x1, y1),
+                   _point_segment_distance_sq_np(x3, y3, x0, y0, x1, y1)))
+    return np.where(crossing, 0, distance)
+
+
+def stroke_array(stroke):
+    """
+    The stroke's samples as an (n, 4) array, cached until points grow.
+    """
+    if stroke.array is None or len(stroke.array) != len(stroke.points):
+        stroke.array = np.asarray(stroke.points, dtype=np.float64).reshape(-1, 4)
+        half_width = stroke.array[:, 3].max() / 2
+        stroke.box = (stroke.array[:, 0].min() - half_width, stroke.array[:, 1].min() - half_width,
+                      stroke.array[:, 0].max() + half_width, stroke.array[:, 1].max() + half_width)
+    return stroke.array
+
+
+def stroke_box(stroke):
+    """
+    (min_x, min_y, max_x, max_y) of the stroke, widened by its half width.
+    """
+    stroke_array(stroke)
+    return stroke.box
+
+
+def segment_arrays(strokes):
+    """
+    Start samples, end samples and owning stroke number of every segment of
+    strokes, as stacked arrays.
+    """
+    starts, ends, owners = [], [], []
+    for number, stroke in enumerate(strokes):
+        points = stroke_array(stroke)
+        if len(points) == 1:
+            starts.append(points)
+            ends.append(points)
+        else:
+            starts.append(points[:-1])
+            ends.append(points[1:])
+        owners.append(np.full(max(1, len(points) - 1), number))
+    return np.concatenate(starts), np.concatenate(ends), np.concatenate(owners)
+
+
+def find_erased_numpy(strokes, eraser, chunk=1 << 16):
+    """
+    The visible strokes in strokes the eraser stroke passes over, testing
+    every eraser segment against every candidate segment in bulk. Candidates
+    are the segments of the strokes whose box overlaps the eraser's box, and of
+    those the segments whose box does.
+    """
+    if np is None:
+        raise RuntimeError("the numpy backend needs NumPy installed")
+    if not eraser.points:
+        return set()
+    half = eraser.width / 2
+    points = stroke_array(eraser)
+    min_x, min_y = points[:, 0].min() - half, points[:, 1].min() - half
+    max_x, max_y = points[:, 0].max() + half, points[:, 1].max() + half
+    strokes = [stroke for stroke in strokes if stroke.points]
+    strokes = [stroke for stroke, box in zip(strokes, map(stroke_box, strokes))
+               if box[0] <= max_x and box[2] >= min_x and box[1] <= max_y and box[3] >= min_y]
+    if not strokes:
+        return set()
+    starts, ends, owners = segment_arrays(strokes)
+    ax, ay, bx, by = starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+    half_widths = np.maximum(starts[:, 3], ends[:, 3]) / 2
+    eraser_starts, eraser_ends, _ = segment_arrays([eraser])
+    eraser_segments = np.column_stack((eraser_starts[:, :2], eraser_ends[:, :2]))
+    reach = half + half_widths
+    near = ((np.minimum(ax, bx) - half_widths <= max_x) & (np.maximum(ax, bx) + half_widths >= min_x) &
+            (np.minimum(ay, by) - half_widths <= max_y) & (np.maximum(ay, by) + half_widths >= min_y))
+    candidates = np.flatnonzero(near)
+    hit = np.zeros(len(owners), dtype=bool)
+    rows = max(1, chunk // max(1, len(eraser_segments)))
+    for start in range(0, len(candidates), rows):
+        index = candidates[start:start + rows]
+        distance = segment_distance_sq_np(
+            ax[index, None], ay[index, None], bx[index, None], by[index, None],
+            eraser_segments[None, :, 0], eraser_segments[None, :, 1],
+            eraser_segments[None, :, 2], eraser_segments[None, :, 3])
+        hit[index] = (distance <= (reach[index, None] ** 2)).any(axis=1)
+    return {id(strokes[number]) for number in np.unique(owners[hit])}
+
+
+class StrokeEngine:
+    """
+    strokes_data and redo_stack of the page, with the pointer-down, move, up,
+    undo and redo paths that change them.
+    """
+
+    def __init__(self, backend="grid"):
+        if backend not in BACKENDS:
+            raise ValueError("Unknown hit-testing backend %r" % backend)
+        self.backend = backend
+        self.strokes = []
+        self.redo_stack = []
+        self.grid = SegmentGrid() if backend == "grid" else None
+        self.live_stroke = None
+
+    def begin_stroke(self, tool, color="#000000", width=4, opacity=1.0):
+        """
+        Start a stroke (pointer down). Starting a stroke drops the redo stack.
+        """
+        self.end_stroke()
+        self.redo_stack = []
+        stroke = Stroke(tool, color, ERASER_WIDTH if tool == "eraser" else width, opacity)
+        self.strokes.append(stroke)
+        self.live_stroke = stroke
+        return stroke
+
+    def add_point(self, x, y, pressure=0.5, width=None):
+        """
+        Append a sample to the stroke being drawn (pointer move).
+        """
+        stroke = self.live_stroke
+        stroke.points.append((x, y, pressure, stroke.width if width is None else width))
+
+    def end_stroke(self):
+        """
+        Commit the stroke being drawn (pointer up); an eraser erases.
+        """
+        stroke = self.live_stroke
+        if stroke is None:
+            return
+        self.live_stroke = None
+        if not stroke.points:
+            self.strokes.pop()
+            return
+        if stroke.tool == "eraser":
+            self.erase(stroke)
+        elif self.grid:
+            self.grid.add(stroke)
+
+    def add_stroke(self, tool, points, color="#000000", width=4, opacity=1.0):
+        """
+        Draw a whole stroke from a list of (x, y, pressure, width) samples.
+        """
+        stroke = self.begin_stroke(tool, color, width, opacity)
+        stroke.points = list(points)
+        self.end_stroke()
+        return stroke
+
+    def erase(self, eraser):
+        """
+        Hide the visible strokes before eraser that it passes over, like
+        erase_with() on the page.
+        """
+        index = self.strokes.index(eraser)
+        if self.backend == "numpy":
+            candidates = [stroke for stroke in self.strokes[:index]
+                          if stroke.tool != "eraser" and stroke.visible]
+            hits = find_erased_numpy(candidates, eraser)
+        else:
+            hits = self.grid.find_erased(eraser)
+        eraser.erased_indices = []
+        for i in range(index):
+            if id(self.strokes[i]) in hits:
+                self.strokes[i].visible = False
+                eraser.erased_indices.append(i)
+
+    def undo(self):
+        self.end_stroke()
+        if not self.strokes:
+            return False
+        stroke = self.strokes.pop()
+        self.redo_stack.append(stroke)
+        if stroke.tool == "eraser":
+            for index in stroke.erased_indices or ():
+                if index < len(self.strokes):
+                    self.strokes[index].visible = True
+        elif self.grid:
+            self.grid.remove(stroke)
+        return True
+
+    def redo(self):
+        self.end_stroke()
+        if not self.redo_stack:
+            return False
+        stroke = self.redo_stack.pop()
+        self.strokes.append(stroke)
+        if stroke.tool == "eraser":
+            if stroke.erased_indices is None:
+                self.erase(stroke)
+            for index in stroke.erased_indices:
+                if index < len(self.strokes):
+                    self.strokes[index].visible = False
+        elif self.grid:
+            self.grid.add(stroke)
+        return True
+
+    def visible_strokes(self):
+        return [stroke for stroke in self.strokes if stroke.tool != "eraser" and stroke.visible]
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Copyright: Vijay <http://t.me/Viiijay1>
+# License: GNU GPL, version 3 or later; http://www.gnu.org/copyleft/gpl.html
+"""
+The toolbar and canvas location dialog. Imported when the dialog is first
+opened rather than with the add-on, so its widgets cost nothing at startup.
+"""
+from aqt.qt import QColor, QColorDialog, QCheckBox, QComboBox, QDialog, QHBoxLayout, QLabel,\
+   QPushButton, QSpinBox, QVBoxLayout
+
+
+class CustomDialog(QDialog):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("AnkiPenDown Toolbar And Canvas")
+        self.combo_box = QComboBox()
+        self.combo_box.addItem("Top-Left")
+        self.combo_box.addItem("Top-Right")
+        self.combo_box.addItem("Bottom-Left")
+        self.combo_box.addItem("Bottom-Right")
+        combo_label = QLabel("Location:")
+        range_label = QLabel("Offset:")
+        start_range_label = QLabel("X Offset:")
+        self.start_spin_box = QSpinBox()
+        self.start_spin_box.setRange(0, 1000)
+        small_width_label = QLabel("Non-Fullscreen Canvas Width:")
+        self.small_width_spin_box = QSpinBox()
+        self.small_width_spin_box.setRange(0, 9999)
+        small_height_label = QLabel("Non-Fullscreen Canvas Height:")
+        self.small_height_spin_box = QSpinBox()
+        self.small_height_spin_box.setRange(0, 9999)
+        end_range_label = QLabel("Y Offset:")
+        self.end_spin_box = QSpinBox()
+        self.end_spin_box.setRange(0, 1000)
+        range_layout = QVBoxLayout()
+        small_height_layout = QHBoxLayout()
+        small_height_layout.addWidget(small_height_label)
+        small_height_layout.addWidget(self.small_height_spin_box)
+        small_width_layout = QHBoxLayout()
+        small_width_layout.addWidget(small_width_label)
+        small_width_layout.addWidget(self.small_width_spin_box)
+        color_layout = QHBoxLayout()
+        self.color_button = QPushButton("Select Color")
+        self.color_button.clicked.connect(self.select_color)
+        self.color_label = QLabel("Background color: #FFFFFF00")  # Initial color label
+        color_layout.addWidget(self.color_label)
+        color_layout.addWidget(self.color_button)
+        start_layout = QHBoxLayout()
+        start_layout.addWidget(start_range_label)
+        start_layout.addWidget(self.start_spin_box)
+        end_layout = QHBoxLayout()
+        end_layout.addWidget(end_range_label)
+        end_layout.addWidget(self.end_spin_box)
+        range_layout.addLayout(start_layout)
+        range_layout.addLayout(end_layout)
+        range_layout.addLayout(small_width_layout)
+        range_layout.addLayout(small_height_layout)
+        checkbox_label2 = QLabel("Orient vertically:")
+        self.checkbox2 = QCheckBox()
+        checkbox_layout2 = QHBoxLayout()
+        checkbox_layout2.addWidget(checkbox_label2)
+        checkbox_layout2.addWidget(self.checkbox2)
+        accept_button = QPushButton("Accept")
+        cancel_button = QPushButton("Cancel")
+        reset_button = QPushButton("Default")
+        accept_button.clicked.connect(self.accept)
+        cancel_button.clicked.connect(self.reject)
+        reset_button.clicked.connect(self.reset_to_default)
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(accept_button)
+        button_layout.addWidget(reset_button)
+        button_layout.addWidget(cancel_button)
+        dialog_layout = QVBoxLayout()
+        dialog_layout.addWidget(combo_label)
+        dialog_layout.addWidget(self.combo_box)
+        dialog_layout.addWidget(range_label)
+        dialog_layout.addLayout(range_layout)
+        dialog_layout.addLayout(checkbox_layout2)
+        dialog_layout.addLayout(color_layout)
+        dialog_layout.addLayout(button_layout)
+        self.setLayout(dialog_layout)
+    def set_values(self, combo_index, start_value, end_value, checkbox_state2, width, height, background_color):
+        self.combo_box.setCurrentIndex(combo_index)
+        self.start_spin_box.setValue(start_value)
+        self.small_height_spin_box.setValue(height)
+        self.small_width_spin_box.setValue(width)
+        self.end_spin_box.setValue(end_value)
+        self.checkbox2.setChecked(checkbox_state2)
+        self.color_label.setText(f"Background color: {background_color}")
+    def reset_to_default(self):
+        self.combo_box.setCurrentIndex(1)
+        self.start_spin_box.setValue(2)
+        self.end_spin_box.setValue(2)
+        self.small_height_spin_box.setValue(500)
+        self.small_width_spin_box.setValue(500)
+        self.checkbox2.setChecked(True)
+        self.color_label.setText("Background color: #FFFFFF00")  # Reset color label
+    def select_color(self):
+        color_dialog = QColorDialog()
+        qcolor_old = QColor(self.color_label.text()[-9:-2])
+        color = color_dialog.getColor(qcolor_old, options=QColorDialog.ColorDialogOption.ShowAlphaChannel)
+        if color.isValid():
+            self.color_label.setText(f"Background color: {(color.name()+color.name(QColor.NameFormat.HexArgb)[1:3]).upper()}")
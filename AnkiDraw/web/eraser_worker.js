@@ -0,0 +1,55 @@
+/*
+ * AnkiPenDown eraser worker.
+ *
+ * Keeps a mirror of every stroke the page has indexed, by id, in its own
+ * segment grid, and answers eraser queries against it off the main thread.
+ * Messages are handled in the order they were posted, so a query sees exactly
+ * the strokes that were indexed before it was sent.
+ */
+// The page loads this worker with the cache-busting query of its own
+// scripts; geometry.js is fetched with the same one.
+importScripts('geometry.js' + self.location.search);
+
+var grid = new Map();
+var strokes = new Map();
+
+onmessage = function(e) {
+    var message = e.data;
+    var stroke;
+    switch (message.type) {
+    case 'add':
+        stroke = {id: message.id, visible: message.visible, points: {data: message.data, length: message.length}};
+        strokes.set(stroke.id, stroke);
+        grid_add(grid, stroke);
+        break;
+    case 'remove':
+        stroke = strokes.get(message.id);
+        if (stroke) {
+            grid_remove(grid, stroke);
+            strokes.delete(message.id);
+        }
+        break;
+    case 'visible':
+        stroke = strokes.get(message.id);
+        if (stroke) {
+            stroke.visible = message.visible;
+        }
+        break;
+    case 'clear':
+        grid.clear();
+        strokes.clear();
+        break;
+    case 'query':
+        var eraser = {width: message.width, points: {data: message.data, length: message.length}};
+        var ids = [];
+        var cuts = message.precise ? [] : null;
+        find_erased(grid, eraser, message.precise).forEach(function(cut, hit) {
+            ids.push(hit.id);
+            if (cuts) {
+                cuts.push(cut);
+            }
+        });
+        postMessage({type: 'erased', query: message.query, ids: ids, cuts: cuts});
+        break;
+    }
+};
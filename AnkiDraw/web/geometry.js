@@ -0,0 +1,319 @@
+/*
+ * AnkiPenDown stroke geometry.
+ *
+ * Shared by the page (pendown.js) and its workers (eraser_worker.js and
+ * render_worker.js): point buffers, segment distance tests, the uniform grid
+ * the eraser queries, and the outline committed strokes are filled with.
+ * Nothing here touches the DOM.
+ */
+// Stroke points are packed as (x, y, pressure, width) quadruples into one
+// growable Float32Array per stroke; the buffer doubles when it runs out and is
+// trimmed to size once the stroke is committed.
+var POINT_STRIDE = 4;
+function new_point_buffer(capacity) {
+    return {data: new Float32Array((capacity || 32) * POINT_STRIDE), length: 0};
+}
+function push_point(points, x, y, pressure, width) {
+    var offset = points.length * POINT_STRIDE;
+    if (offset + POINT_STRIDE > points.data.length) {
+        var grown = new Float32Array(Math.max(points.data.length * 2, 8 * POINT_STRIDE));
+        grown.set(points.data);
+        points.data = grown;
+    }
+    points.data[offset] = x;
+    points.data[offset + 1] = y;
+    points.data[offset + 2] = pressure;
+    points.data[offset + 3] = width;
+    points.length++;
+}
+function trim_point_buffer(points) {
+    if (points.data.length > points.length * POINT_STRIDE) {
+        points.data = points.data.slice(0, points.length * POINT_STRIDE);
+    }
+}
+function doLineSegmentsIntersect(x0, y0, x1, y1, x2, y2, x3, y3) {
+    var s1_x = x1 - x0;
+    var s1_y = y1 - y0;
+    var s2_x = x3 - x2;
+    var s2_y = y3 - y2;
+    var s = (-s1_y * (x0 - x2) + s1_x * (y0 - y2)) / (-s2_x * s1_y + s1_x * s2_y);
+    var t = ( s2_x * (y0 - y2) - s2_y * (x0 - x2)) / (-s2_x * s1_y + s1_x * s2_y);
+    if (s >= 0 && s <= 1 && t >= 0 && t <= 1) {
+        return true;
+    }
+    return false;
+}
+function pointSegmentDistanceSq(px, py, ax, ay, bx, by) {
+    var dx = bx - ax;
+    var dy = by - ay;
+    var len_sq = dx * dx + dy * dy;
+    var t = 0;
+    if (len_sq > 0) {
+        t = ((px - ax) * dx + (py - ay) * dy) / len_sq;
+        t = Math.max(0, Math.min(1, t));
+    }
+    var ex = ax + t * dx - px;
+    var ey = ay + t * dy - py;
+    return ex * ex + ey * ey;
+}
+function segmentDistanceSq(x0, y0, x1, y1, x2, y2, x3, y3) {
+    if (doLineSegmentsIntersect(x0, y0, x1, y1, x2, y2, x3, y3)) {
+        return 0;
+    }
+    return Math.min(
+        pointSegmentDistanceSq(x0, y0, x2, y2, x3, y3),
+        pointSegmentDistanceSq(x1, y1, x2, y2, x3, y3),
+        pointSegmentDistanceSq(x2, y2, x0, y0, x1, y1),
+        pointSegmentDistanceSq(x3, y3, x0, y0, x1, y1)
+    );
+}
+// Narrows [lo, hi] to the t where f0 + t * fd lies in [min, max].
+function clip_linear_range(range, f0, fd, min, max) {
+    if (fd === 0) {
+        if (f0 < min || f0 > max) range[1] = -Infinity;
+        return;
+    }
+    var t0 = (min - f0) / fd, t1 = (max - f0) / fd;
+    range[0] = Math.max(range[0], Math.min(t0, t1));
+    range[1] = Math.min(range[1], Math.max(t0, t1));
+}
+// The t of the points a + t * (b - a) within reach of the center c.
+function disc_span(ax, ay, dx, dy, cx, cy, reach) {
+    var fx = ax - cx, fy = ay - cy;
+    var a = dx * dx + dy * dy;
+    var c = fx * fx + fy * fy - reach * reach;
+    if (a === 0) return c <= 0 ? [-Infinity, Infinity] : null;
+    var b = fx * dx + fy * dy;
+    var discriminant = b * b - a * c;
+    if (discriminant < 0) return null;
+    var root = Math.sqrt(discriminant);
+    return [(-b - root) / a, (-b + root) / a];
+}
+// The part [t0, t1] of the segment a-b within reach of the segment e0-e1, as
+// fractions of a-b, or null. The points within reach of e0-e1 form a capsule
+// (a disc at either end and the band between them), which is convex, so the
+// part is one interval: from the first entry into any piece to the last exit.
+function erased_span(ax, ay, bx, by, ex0, ey0, ex1, ey1, reach) {
+    var dx = bx - ax, dy = by - ay;
+    var pieces = [disc_span(ax, ay, dx, dy, ex0, ey0, reach), disc_span(ax, ay, dx, dy, ex1, ey1, reach)];
+    var vx = ex1 - ex0, vy = ey1 - ey0;
+    var length = Math.sqrt(vx * vx + vy * vy);
+    if (length > 0) {
+        var band = [-Infinity, Infinity];
+        var rx = ax - ex0, ry = ay - ey0;
+        clip_linear_range(band, (rx * vx + ry * vy) / length, (dx * vx + dy * vy) / length, 0, length);
+        clip_linear_range(band, (rx * vy - ry * vx) / length, (dx * vy - dy * vx) / length, -reach, reach);
+        if (band[0] <= band[1]) pieces.push(band);
+    }
+    var t0 = Infinity, t1 = -Infinity;
+    pieces.forEach(function(piece) {
+        if (piece) {
+            t0 = Math.min(t0, piece[0]);
+            t1 = Math.max(t1, piece[1]);
+        }
+    });
+    t0 = Math.max(0, t0);
+    t1 = Math.min(1, t1);
+    return t0 <= t1 ? [t0, t1] : null;
+}
+// Uniform grid of stroke segments, so the eraser only has to look at the
+// segments lying in the cells it passes through. A grid is a Map from cell key
+// to a flat list of (stroke, segment index) pairs; strokes remember their
+// cells so they can be removed again.
+var GRID_CELL_SIZE = 64;
+function update_stroke_bbox(stroke) {
+    var data = stroke.points.data;
+    var half_width = 0;
+    var bbox = {min_x: Infinity, min_y: Infinity, max_x: -Infinity, max_y: -Infinity};
+    for (var o = 0; o < stroke.points.length * POINT_STRIDE; o += POINT_STRIDE) {
+        bbox.min_x = Math.min(bbox.min_x, data[o]);
+        bbox.min_y = Math.min(bbox.min_y, data[o + 1]);
+        bbox.max_x = Math.max(bbox.max_x, data[o]);
+        bbox.max_y = Math.max(bbox.max_y, data[o + 1]);
+        half_width = Math.max(half_width, data[o + 3] / 2);
+    }
+    bbox.min_x -= half_width;
+    bbox.min_y -= half_width;
+    bbox.max_x += half_width;
+    bbox.max_y += half_width;
+    stroke.bbox = bbox;
+    return bbox;
+}
+function for_each_grid_cell(min_x, min_y, max_x, max_y, callback) {
+    var x0 = Math.floor(min_x / GRID_CELL_SIZE);
+    var y0 = Math.floor(min_y / GRID_CELL_SIZE);
+    var x1 = Math.floor(max_x / GRID_CELL_SIZE);
+    var y1 = Math.floor(max_y / GRID_CELL_SIZE);
+    for (var cx = x0; cx <= x1; cx++) {
+        for (var cy = y0; cy <= y1; cy++) {
+            callback(cx + ',' + cy);
+        }
+    }
+}
+// Calls callback(i, a, b) for every segment of the stroke, where a and b are
+// the offsets of its end points in stroke.points.data. A single-point stroke
+// yields one degenerate segment.
+function for_each_segment(stroke, callback) {
+    var count = stroke.points.length;
+    if (count === 1) {
+        callback(0, 0, 0);
+        return;
+    }
+    for (var i = 0; i < count - 1; i++) {
+        callback(i, i * POINT_STRIDE, (i + 1) * POINT_STRIDE);
+    }
+}
+function grid_add(grid, stroke) {
+    var data = stroke.points.data;
+    var cells = new Set();
+    for_each_segment(stroke, function(i, a, b) {
+        var half_width = Math.max(data[a + 3], data[b + 3]) / 2;
+        for_each_grid_cell(
+            Math.min(data[a], data[b]) - half_width, Math.min(data[a + 1], data[b + 1]) - half_width,
+            Math.max(data[a], data[b]) + half_width, Math.max(data[a + 1], data[b + 1]) + half_width,
+            function(key) {
+                var cell = grid.get(key);
+                if (!cell) {
+                    cell = [];
+                    grid.set(key, cell);
+                }
+                cell.push(stroke, i);
+                cells.add(key);
+            });
+    });
+    stroke.grid_cells = Array.from(cells);
+}
+function grid_remove(grid, stroke) {
+    if (!stroke.grid_cells) return;
+    stroke.grid_cells.forEach(function(key) {
+        var cell = grid.get(key);
+        if (!cell) return;
+        var kept = [];
+        for (var k = 0; k < cell.length; k += 2) {
+            if (cell[k] !== stroke) {
+                kept.push(cell[k], cell[k + 1]);
+            }
+        }
+        if (kept.length) {
+            grid.set(key, kept);
+        } else {
+            grid.delete(key);
+        }
+    });
+    stroke.grid_cells = null;
+}
+function doesSegmentHitEraser(stroke, i, ex0, ey0, ex1, ey1, eraser_half_width) {
+    var data = stroke.points.data;
+    var a = i * POINT_STRIDE;
+    var b = Math.min(i + 1, stroke.points.length - 1) * POINT_STRIDE;
+    var reach = eraser_half_width + Math.max(data[a + 3], data[b + 3]) / 2;
+    return segmentDistanceSq(data[a], data[a + 1], data[b], data[b + 1], ex0, ey0, ex1, ey1) <= reach * reach;
+}
+// Calls callback(stroke, segment, ex0, ey0, ex1, ey1, eraser_half_width) for
+// every visible stroke segment in grid the eraser stroke passes over,
+// possibly more than once for the same pair.
+function for_each_erased_segment(grid, eraserStroke, callback) {
+    var eraser_data = eraserStroke.points.data;
+    var eraser_half_width = eraserStroke.width / 2;
+    for_each_segment(eraserStroke, function(j, a, b) {
+        var ex0 = eraser_data[a], ey0 = eraser_data[a + 1];
+        var ex1 = eraser_data[b], ey1 = eraser_data[b + 1];
+        for_each_grid_cell(
+            Math.min(ex0, ex1) - eraser_half_width, Math.min(ey0, ey1) - eraser_half_width,
+            Math.max(ex0, ex1) + eraser_half_width, Math.max(ey0, ey1) + eraser_half_width,
+            function(key) {
+                var cell = grid.get(key);
+                if (!cell) return;
+                for (var k = 0; k < cell.length; k += 2) {
+                    var candidate = cell[k];
+                    if (candidate.visible === false) continue;
+                    if (doesSegmentHitEraser(candidate, cell[k + 1], ex0, ey0, ex1, ey1, eraser_half_width)) {
+                        callback(candidate, cell[k + 1], ex0, ey0, ex1, ey1, eraser_half_width);
+                    }
+                }
+            });
+    });
+}
+// Returns a Map from every stroke in grid the eraser stroke touches to true,
+// or, when precise, to its cut: the stroke's sample count (length) and a flat
+// list of (segment, t0, t1) spans, the parts of its segments, as fractions of
+// their length, whose ink the eraser touches. Spans may overlap.
+function find_erased(grid, eraserStroke, precise) {
+    var hits = new Map();
+    for_each_erased_segment(grid, eraserStroke, function(stroke, i, ex0, ey0, ex1, ey1, eraser_half_width) {
+        if (!precise) {
+            hits.set(stroke, true);
+            return;
+        }
+        var cut = hits.get(stroke);
+        if (!cut) {
+            cut = {length: stroke.points.length, spans: []};
+            hits.set(stroke, cut);
+        }
+        var data = stroke.points.data;
+        var a = i * POINT_STRIDE;
+        var b = Math.min(i + 1, stroke.points.length - 1) * POINT_STRIDE;
+        var reach = eraser_half_width + Math.max(data[a + 3], data[b + 3]) / 2;
+        var span = erased_span(data[a], data[a + 1], data[b], data[b + 1], ex0, ey0, ex1, ey1, reach);
+        if (span) {
+            cut.spans.push(i, span[0], span[1]);
+        }
+    });
+    return hits;
+}
+// Committed strokes are drawn as one filled outline. The quadratic curves
+// through the sample midpoints (the curve the live stroke is drawn with) are
+// flattened, each piece becomes a trapezoid between the widths at its ends,
+// and a disc is added at every joint for round joins (and at the ends for
+// round caps). Every sub-path winds the same way, so one nonzero fill paints
+// overlaps exactly once.
+function flatten_stroke(stroke) {
+    var data = stroke.points.data;
+    var count = stroke.points.length;
+    var line = [data[0], data[1], data[3]];
+    for (var j = 1; j < count; j++) {
+        var p1 = Math.max(j - 2, 0) * POINT_STRIDE;
+        var p2 = (j - 1) * POINT_STRIDE;
+        var p3 = j * POINT_STRIDE;
+        var sx = (data[p1] + data[p2]) / 2, sy = (data[p1 + 1] + data[p2 + 1]) / 2;
+        var ex = (data[p2] + data[p3]) / 2, ey = (data[p2 + 1] + data[p3 + 1]) / 2;
+        var sw = line[line.length - 1];
+        var length = Math.hypot(data[p2] - sx, data[p2 + 1] - sy) + Math.hypot(ex - data[p2], ey - data[p2 + 1]);
+        var steps = Math.max(1, Math.min(8, Math.ceil(length / 4)));
+        for (var k = 1; k <= steps; k++) {
+            var t = k / steps, u = 1 - t;
+            line.push(
+                u * u * sx + 2 * u * t * data[p2] + t * t * ex,
+                u * u * sy + 2 * u * t * data[p2 + 1] + t * t * ey,
+                sw + t * (data[p3 + 3] - sw));
+        }
+    }
+    var last = (count - 1) * POINT_STRIDE;
+    line.push(data[last], data[last + 1], data[last + 3]);
+    return line;
+}
+function build_stroke_path(stroke) {
+    var path = new Path2D();
+    var line = flatten_stroke(stroke);
+    var round_caps = stroke.tool !== 'highlighter';
+    for (var i = 0; i < line.length; i += 3) {
+        var x0 = line[i], y0 = line[i + 1], r0 = line[i + 2] / 2;
+        var is_end = (i === 0 || i === line.length - 3);
+        if (round_caps || !is_end) {
+            path.moveTo(x0 + r0, y0);
+            path.arc(x0, y0, r0, 0, 2 * Math.PI);
+            path.closePath();
+        }
+        if (i + 3 >= line.length) break;
+        var x1 = line[i + 3], y1 = line[i + 4], r1 = line[i + 5] / 2;
+        var length = Math.hypot(x1 - x0, y1 - y0);
+        if (length === 0) continue;
+        var nx = -(y1 - y0) / length, ny = (x1 - x0) / length;
+        path.moveTo(x0 - nx * r0, y0 - ny * r0);
+        path.lineTo(x1 - nx * r1, y1 - ny * r1);
+        path.lineTo(x1 + nx * r1, y1 + ny * r1);
+        path.lineTo(x0 + nx * r0, y0 + ny * r0);
+        path.closePath();
+    }
+    return path;
+}
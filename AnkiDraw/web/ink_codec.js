@@ -0,0 +1,209 @@
+/*
+ * AnkiPenDown drawing codec.
+ *
+ * The binary form of a drawing, used wherever strokes leave the page (saving,
+ * export) and read back by ink_codec.py, which must stay byte-compatible.
+ * Integers are LEB128 varints, signed ones zigzag-encoded first:
+ *
+ *   "PD", format version, coordinate scale (units per CSS pixel),
+ *   color count, colors (UTF-8 length and bytes), stroke count,
+ *   then per stroke: tool, flags (1 = visible), color index, opacity (0-255),
+ *   nominal width (scaled), point count, x and y of every point as deltas of
+ *   the scaled coordinates (the first from 0, 0), and the pressures
+ *   (hundredths) and widths (scaled) as runs of (run length, value).
+ */
+var INK_CODEC_MAGIC = [0x50, 0x44];
+var INK_CODEC_VERSION = 1;
+var INK_CODEC_SCALE = 8;
+var INK_CODEC_TOOLS = ['pen', 'highlighter', 'eraser'];
+var INK_CODEC_VISIBLE = 1;
+function ink_quantize(value, scale) {
+    return Math.floor(value * scale + 0.5);
+}
+function ink_writer(capacity) {
+    return {bytes: new Uint8Array(capacity || 1024), length: 0};
+}
+function write_byte(writer, value) {
+    if (writer.length === writer.bytes.length) {
+        var grown = new Uint8Array(writer.bytes.length * 2);
+        grown.set(writer.bytes);
+        writer.bytes = grown;
+    }
+    writer.bytes[writer.length++] = value;
+}
+function write_varint(writer, value) {
+    while (value >= 128) {
+        write_byte(writer, value % 128 + 128);
+        value = Math.floor(value / 128);
+    }
+    write_byte(writer, value);
+}
+function write_signed(writer, value) {
+    write_varint(writer, value >= 0 ? value * 2 : -value * 2 - 1);
+}
+function write_text(writer, text) {
+    var bytes = new TextEncoder().encode(text);
+    write_varint(writer, bytes.length);
+    for (var i = 0; i < bytes.length; i++) {
+        write_byte(writer, bytes[i]);
+    }
+}
+// Writes count values as runs of (run length, value); value(i) gives the
+// i-th one.
+function write_runs(writer, count, value) {
+    var i = 0;
+    while (i < count) {
+        var run_value = value(i);
+        var j = i + 1;
+        while (j < count && value(j) === run_value) j++;
+        write_varint(writer, j - i);
+        write_varint(writer, run_value);
+        i = j;
+    }
+}
+// strokes are page strokes: {tool, color, width, opacity, visible, points}
+// with points a point buffer (see geometry.js). Returns a Uint8Array.
+function encode_drawing(strokes) {
+    var writer = ink_writer();
+    var colors = [];
+    var color_index = new Map();
+    strokes.forEach(function(stroke) {
+        if (!color_index.has(stroke.color)) {
+            color_index.set(stroke.color, colors.length);
+            colors.push(stroke.color);
+        }
+    });
+    INK_CODEC_MAGIC.forEach(function(value) { write_byte(writer, value); });
+    write_varint(writer, INK_CODEC_VERSION);
+    write_varint(writer, INK_CODEC_SCALE);
+    write_varint(writer, colors.length);
+    colors.forEach(function(color) { write_text(writer, color); });
+    write_varint(writer, strokes.length);
+    strokes.forEach(function(stroke) {
+        var data = stroke.points.data;
+        var count = stroke.points.length;
+        write_varint(writer, Math.max(0, INK_CODEC_TOOLS.indexOf(stroke.tool)));
+        write_varint(writer, stroke.visible === false ? 0 : INK_CODEC_VISIBLE);
+        write_varint(writer, color_index.get(stroke.color));
+        write_varint(writer, Math.min(255, Math.max(0, ink_quantize(stroke.opacity, 255))));
+        write_varint(writer, Math.max(0, ink_quantize(stroke.width, INK_CODEC_SCALE)));
+        write_varint(writer, count);
+        var x = 0, y = 0;
+        for (var i = 0; i < count; i++) {
+            var qx = ink_quantize(data[i * POINT_STRIDE], INK_CODEC_SCALE);
+            var qy = ink_quantize(data[i * POINT_STRIDE + 1], INK_CODEC_SCALE);
+            write_signed(writer, qx - x);
+            write_signed(writer, qy - y);
+            x = qx;
+            y = qy;
+        }
+        write_runs(writer, count, function(i) {
+            return Math.max(0, ink_quantize(data[i * POINT_STRIDE + 2], 100));
+        });
+        write_runs(writer, count, function(i) {
+            return Math.max(0, ink_quantize(data[i * POINT_STRIDE + 3], INK_CODEC_SCALE));
+        });
+    });
+    return writer.bytes.slice(0, writer.length);
+}
+function ink_reader(bytes) {
+    return {bytes: bytes, offset: 0};
+}
+function read_varint(reader) {
+    var value = 0, factor = 1, byte;
+    do {
+        if (reader.offset >= reader.bytes.length) throw new Error('Truncated drawing');
+        byte = reader.bytes[reader.offset++];
+        value += (byte % 128) * factor;
+        factor *= 128;
+    } while (byte >= 128);
+    return value;
+}
+function read_signed(reader) {
+    var value = read_varint(reader);
+    return value % 2 ? -(value + 1) / 2 : value / 2;
+}
+function read_text(reader) {
+    var length = read_varint(reader);
+    if (reader.offset + length > reader.bytes.length) throw new Error('Truncated drawing');
+    var bytes = reader.bytes.subarray(reader.offset, reader.offset + length);
+    reader.offset += length;
+    return new TextDecoder().decode(bytes);
+}
+function read_runs(reader, count, callback) {
+    var i = 0;
+    while (i < count) {
+        var run = read_varint(reader);
+        var value = read_varint(reader);
+        if (run === 0) throw new Error('Empty run in drawing');
+        for (var end = Math.min(count, i + run); i < end; i++) {
+            callback(i, value);
+        }
+    }
+}
+function read_entry(reader, table, what) {
+    var index = read_varint(reader);
+    if (index >= table.length) throw new Error('Unknown ' + what + ' ' + index + ' in drawing');
+    return table[index];
+}
+// Every point takes at least two bytes (its x and y deltas).
+function read_point_count(reader) {
+    var count = read_varint(reader);
+    if (count * 2 > reader.bytes.length - reader.offset) throw new Error('Truncated drawing');
+    return count;
+}
+// Returns page strokes, each with its points in a fresh point buffer.
+function decode_drawing(bytes) {
+    var reader = ink_reader(bytes);
+    if (bytes[0] !== INK_CODEC_MAGIC[0] || bytes[1] !== INK_CODEC_MAGIC[1]) {
+        throw new Error('Not a drawing');
+    }
+    reader.offset = 2;
+    var version = read_varint(reader);
+    if (version !== INK_CODEC_VERSION) throw new Error('Unknown drawing version ' + version);
+    var scale = read_varint(reader);
+    if (scale === 0) throw new Error('Drawing has no coordinate scale');
+    var colors = [];
+    for (var c = read_varint(reader); c > 0; c--) {
+        colors.push(read_text(reader));
+    }
+    var strokes = [];
+    for (var s = read_varint(reader); s > 0; s--) {
+        var stroke = {
+            tool: read_entry(reader, INK_CODEC_TOOLS, 'tool'),
+            visible: (read_varint(reader) & INK_CODEC_VISIBLE) !== 0,
+            color: read_entry(reader, colors, 'color'),
+            opacity: read_varint(reader) / 255,
+            width: read_varint(reader) / scale
+        };
+        var count = read_point_count(reader);
+        var data = new Float32Array(count * POINT_STRIDE);
+        var x = 0, y = 0;
+        for (var i = 0; i < count; i++) {
+            x += read_signed(reader);
+            y += read_signed(reader);
+            data[i * POINT_STRIDE] = x / scale;
+            data[i * POINT_STRIDE + 1] = y / scale;
+        }
+        read_runs(reader, count, function(i, value) { data[i * POINT_STRIDE + 2] = value / 100; });
+        read_runs(reader, count, function(i, value) { data[i * POINT_STRIDE + 3] = value / scale; });
+        stroke.points = {data: data, length: count};
+        strokes.push(stroke);
+    }
+    return strokes;
+}
+function bytes_to_base64(bytes) {
+    var text = '';
+    for (var i = 0; i < bytes.length; i += 0x8000) {
+        text += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+    }
+    return btoa(text);
+}
+function base64_to_bytes(text) {
+    var binary = atob(text);
+    var bytes = new Uint8Array(binary.length);
+    for (var i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return bytes;
+}
@@ -0,0 +1,1795 @@
+/*
+ * AnkiPenDown drawing script.
+ *
+ * The settings it reads (visible, small_canvas, fullscreen_follow,
+ * coalesced_input, simplify_tolerance, precise_eraser, offscreen_rendering,
+ * diagnostics, line_width, pen1_color, pen2_color, pendown_web_base and
+ * pendown_web_version) are globals defined by the inline settings block that
+ * __init__.py generates in front of this script. Stroke geometry comes from
+ * geometry.js and the saved-drawing format from ink_codec.js, both loaded
+ * just before it.
+ */
+document.currentScript.insertAdjacentHTML('beforebegin', `
+<div id="canvas_wrapper">
+    <canvas id="highlighter_canvas" width="100" height="100"></canvas>
+    <canvas id="pen_canvas" width="100" height="100"></canvas>
+    <canvas id="live_canvas" width="100" height="100"></canvas>
+    <div id="pencil_button_bar">
+        <button id="ts_visibility_button" class="active" title="Toggle visiblity (, comma)"
+              onclick="switch_visibility();" >
+        <svg viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg">
+            <path d="M17.94 17.94A10.07 10.07 0 0 1 12 20c-7 0-11-8-11-8a18.45 18.45 0 0 1 5.06-5.94M9.9 4.24A9.12 9.12 0 0 1 12 4c7 0 11 8 11 8a18.5 18.5 0 0 1-2.16 3.19m-6.72-1.07a3 3 0 1 1-4.24-4.24" stroke="currentColor" stroke-width="1.8" stroke-linecap="round" stroke-linejoin="round"/>
+            <path d="m1 1 22 22" stroke="currentColor" stroke-width="1.8" stroke-linecap="round" stroke-linejoin="round"/>
+        </svg>
+        </button>
+        <button id="ts_pen1_button" class="color-button active" title="Pen 1"
+              onclick="set_pen_color(pen1_color, this);" style="color: ${pen1_color};">
+        <svg viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg">
+            <path d="M21.174 6.812a1 1 0 0 0-3.986-3.987L3.842 16.174a2 2 0 0 0-.5.83l-1.321 4.352a.5.5 0 0 0 .623.622l4.353-1.32a2 2 0 0 0 .83-.497z" stroke="currentColor" stroke-width="1.8" stroke-linejoin="round"/>
+            <path d="m15 5 4 4" stroke="currentColor" stroke-width="1.8" stroke-linecap="round"/>
+        </svg>
+        </button>
+        <button id="ts_pen2_button" class="color-button" title="Pen 2"
+              onclick="set_pen_color(pen2_color, this);" style="color: ${pen2_color};">
+        <svg viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg">
+            <path d="M21.174 6.812a1 1 0 0 0-3.986-3.987L3.842 16.174a2 2 0 0 0-.5.83l-1.321 4.352a.5.5 0 0 0 .623.622l4.353-1.32a2 2 0 0 0 .83-.497z" stroke="currentColor" stroke-width="1.8" stroke-linejoin="round"/>
+            <path d="m15 5 4 4" stroke="currentColor" stroke-width="1.8" stroke-linecap="round"/>
+            <circle cx="18" cy="7" r="2" fill="currentColor" opacity="0.3"/>
+        </svg>
+        </button>
+        <button id="ts_highlighter_button" class="color-button" title="Highlighter"
+              onclick="set_highlighter_tool(this);" style="color: #FFD700;">
+        <img src="${pendown_web_base}icons/highlighter.svg" alt="">
+        </button>
+        <button id="ts_eraser_button" class="color-button" title="Eraser"
+              onclick="set_eraser_tool(this);" style="color: grey;">
+        <img src="${pendown_web_base}icons/eraser.svg" alt="">
+        </button>
+        <button id="ts_undo_button" title="Undo the last stroke (Alt + z)"
+              onclick="ts_undo();" >
+        <svg viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg">
+            <path d="M3 12a9 9 0 1 0 9-9 9.75 9.75 0 0 0-6.74 2.74L3 8" stroke="currentColor" stroke-width="1.8" stroke-linecap="round" stroke-linejoin="round"/>
+            <path d="M3 3v5h5" stroke="currentColor" stroke-width="1.8" stroke-linecap="round" stroke-linejoin="round"/>
+        </svg>
+        </button>
+        <button id="ts_redo_button" title="Redo the last stroke (Alt + Y)"
+              onclick="ts_redo();" >
+        <svg viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg">
+            <path d="M21 12a9 9 0 1 1-9-9 9.75 9.75 0 0 1 6.74 2.74L21 8" stroke="currentColor" stroke-width="1.8" stroke-linecap="round" stroke-linejoin="round"/>
+            <path d="M21 3v5h-5" stroke="currentColor" stroke-width="1.8" stroke-linecap="round" stroke-linejoin="round"/>
+        </svg>
+        </button>
+        <button class="active" title="Clean canvas (. dot)"
+              onclick="clear_canvas();" >
+        <svg viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg">
+            <path d="M3 6h18" stroke="currentColor" stroke-width="1.8" stroke-linecap="round"/>
+            <path d="M8 6V4a2 2 0 0 1 2-2h4a2 2 0 0 1 2 2v2" stroke="currentColor" stroke-width="1.8" stroke-linecap="round"/>
+            <path d="M19 6v14a2 2 0 0 1-2 2H7a2 2 0 0 1-2-2V6" stroke="currentColor" stroke-width="1.8" stroke-linecap="round"/>
+            <path d="M10 11v6" stroke="currentColor" stroke-width="1.8" stroke-linecap="round"/>
+            <path d="M14 11v6" stroke="currentColor" stroke-width="1.8" stroke-linecap="round"/>
+        </svg>
+        </button>
+        <button id="ts_switch_fullscreen_button" class="active" title="Toggle fullscreen canvas(Alt + b)"
+              onclick="switch_small_canvas();" >
+        <svg viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg">
+            <path d="M8 3H5a2 2 0 0 0-2 2v3" stroke="currentColor" stroke-width="1.8" stroke-linecap="round" stroke-linejoin="round"/>
+            <path d="M21 8V5a2 2 0 0 0-2-2h-3" stroke="currentColor" stroke-width="1.8" stroke-linecap="round" stroke-linejoin="round"/>
+            <path d="M3 16v3a2 2 0 0 0 2 2h3" stroke="currentColor" stroke-width="1.8" stroke-linecap="round" stroke-linejoin="round"/>
+            <path d="M16 21h3a2 2 0 0 0 2-2v-3" stroke="currentColor" stroke-width="1.8" stroke-linecap="round" stroke-linejoin="round"/>
+        </svg>
+        </button>
+    </div>
+</div>
+`);
+var wrapper = document.getElementById('canvas_wrapper');
+var pen_canvas = document.getElementById('pen_canvas');
+var highlighter_canvas = document.getElementById('highlighter_canvas');
+var optionBar = document.getElementById('pencil_button_bar');
+var ts_undo_button = document.getElementById('ts_undo_button');
+var ts_redo_button = document.getElementById('ts_redo_button');
+var live_canvas = document.getElementById('live_canvas');
+// With offscreen_rendering on, the pen and highlighter layers are rasterized
+// in render_worker.js: their canvases are transferred to it, and the layer
+// contexts here (and the checkpoint and scratch canvases made for them) are
+// remote contexts that record canvas calls and post them to the worker once
+// per task. Strokes, checkpoints and dirty rects are still tracked here, so
+// nothing else needs to know where a layer is drawn. The live canvas always
+// stays on the page, so the ink under the pen never waits for the worker.
+// Without OffscreenCanvas (or if the worker fails) the layers are drawn here.
+var render_commands = [];
+var render_transfer = [];
+var render_flush_scheduled = false;
+var next_remote_canvas = 1;
+var next_remote_path = 1;
+var remote_path_generation = 1;
+var render_worker = start_render_worker();
+var pen_ctx = render_worker ? remote_context('pen', pen_canvas.width, pen_canvas.height) : pen_canvas.getContext('2d');
+var highlighter_ctx = render_worker ?
+    remote_context('highlighter', highlighter_canvas.width, highlighter_canvas.height) :
+    highlighter_canvas.getContext('2d');
+var live_ctx = live_canvas.getContext('2d');
+function start_render_worker() {
+    if (!offscreen_rendering || !window.Worker || !window.OffscreenCanvas ||
+            !pen_canvas.transferControlToOffscreen) return null;
+    var worker = null;
+    var canvases;
+    try {
+        worker = new Worker(pendown_web_base + 'render_worker.js?v=' + pendown_web_version);
+        canvases = {pen: pen_canvas.transferControlToOffscreen(),
+            highlighter: highlighter_canvas.transferControlToOffscreen()};
+    } catch (e) {
+        if (worker) worker.terminate();
+        // A canvas that was transferred cannot be drawn on here any more.
+        pen_canvas = replace_canvas(pen_canvas);
+        highlighter_canvas = replace_canvas(highlighter_canvas);
+        return null;
+    }
+    worker.onerror = stop_render_worker;
+    worker.postMessage({type: 'init', canvases: canvases}, [canvases.pen, canvases.highlighter]);
+    return worker;
+}
+function stop_render_worker() {
+    if (!render_worker) return;
+    console.warn('AnkiPenDown: render worker failed, drawing on the main thread');
+    render_worker.terminate();
+    render_worker = null;
+    render_commands = [];
+    render_transfer = [];
+    drop_all_checkpoints();
+    pen_canvas = replace_canvas(pen_canvas);
+    highlighter_canvas = replace_canvas(highlighter_canvas);
+    listen_to_canvases();
+    pen_ctx = layers.pen.ctx = pen_canvas.getContext('2d');
+    highlighter_ctx = layers.highlighter.ctx = highlighter_canvas.getContext('2d');
+    canvas_size = null;
+    request_resize();
+}
+function replace_canvas(canvas) {
+    var fresh = document.createElement('canvas');
+    fresh.id = canvas.id;
+    fresh.style.cssText = canvas.style.cssText;
+    canvas.parentNode.replaceChild(fresh, canvas);
+    return fresh;
+}
+function post_render_command(canvas_id, op, arg, transfer) {
+    render_commands.push(canvas_id, op, arg);
+    if (transfer) render_transfer.push(transfer);
+    if (!render_flush_scheduled) {
+        render_flush_scheduled = true;
+        Promise.resolve().then(flush_render_commands);
+    }
+}
+function flush_render_commands() {
+    render_flush_scheduled = false;
+    if (render_worker && render_commands.length) {
+        render_worker.postMessage({type: 'draw', commands: render_commands}, render_transfer);
+    }
+    render_commands = [];
+    render_transfer = [];
+}
+// Records the subset of CanvasRenderingContext2D the layers are drawn with.
+function remote_context(canvas_id, width, height) {
+    function record(op, arg) {
+        post_render_command(canvas_id, op, arg);
+    }
+    return {
+        remote: true,
+        canvas: {
+            remote_id: canvas_id,
+            get width() { return width; },
+            set width(value) { width = Math.max(0, Math.floor(value)); record('width', width); },
+            get height() { return height; },
+            set height(value) { height = Math.max(0, Math.floor(value)); record('height', height); }
+        },
+        set globalAlpha(value) { record('globalAlpha', value); },
+        set globalCompositeOperation(value) { record('globalCompositeOperation', value); },
+        set fillStyle(value) { record('fillStyle', value); },
+        set lineJoin(value) { record('lineJoin', value); },
+        save: function() { record('save'); },
+        restore: function() { record('restore'); },
+        beginPath: function() { record('beginPath'); },
+        clip: function() { record('clip'); },
+        setTransform: function(a, b, c, d, e, f) { record('setTransform', [a, b, c, d, e, f]); },
+        rect: function(x, y, w, h) { record('rect', [x, y, w, h]); },
+        clearRect: function(x, y, w, h) { record('clearRect', [x, y, w, h]); },
+        drawImage: function(image, x, y) { record('drawImage', [image.remote_id, x, y]); },
+        // Takes the id from remote_stroke_path() instead of a Path2D.
+        fill: function(path_id) { record('fill', path_id); }
+    };
+}
+// A scratch or checkpoint canvas drawn the same way as the layer like_ctx.
+function create_layer_ctx(like_ctx) {
+    if (!like_ctx.remote) {
+        return document.createElement('canvas').getContext('2d');
+    }
+    var canvas_id = next_remote_canvas++;
+    post_render_command(canvas_id, 'create');
+    return remote_context(canvas_id, 1, 1);
+}
+function release_layer_ctx(ctx) {
+    ctx.canvas.width = ctx.canvas.height = 0;
+    if (ctx.remote) {
+        post_render_command(ctx.canvas.remote_id, 'release');
+    }
+}
+// Sends a stroke's points to the worker, which builds and keeps the Path2D,
+// the first time it is painted and whenever its points change.
+function remote_stroke_path(stroke) {
+    if (!stroke.remote_path) {
+        stroke.remote_path = next_remote_path++;
+    }
+    if (stroke.remote_path_points !== stroke.points || stroke.remote_path_generation !== remote_path_generation) {
+        var data = stroke.points.data.slice(0, stroke.points.length * POINT_STRIDE);
+        post_render_command(null, 'path',
+            {id: stroke.remote_path, tool: stroke.tool, data: data, length: stroke.points.length}, data.buffer);
+        stroke.remote_path_points = stroke.points;
+        stroke.remote_path_generation = remote_path_generation;
+    }
+    return stroke.remote_path;
+}
+// Lets the worker drop the path of a stroke that left the layers (undone,
+// hidden by the eraser or replaced by its cut children). It is sent again if
+// the stroke comes back.
+function forget_remote_path(stroke) {
+    if (render_worker && stroke.remote_path && stroke.remote_path_points) {
+        post_render_command(null, 'forget_path', stroke.remote_path);
+        stroke.remote_path_points = null;
+    }
+}
+// Lets the worker drop every path it keeps, once the strokes are replaced.
+function forget_remote_paths() {
+    if (render_worker) {
+        remote_path_generation++;
+        post_render_command(null, 'forget_paths');
+    }
+}
+var ts_visibility_button = document.getElementById('ts_visibility_button');
+var ts_switch_fullscreen_button = document.getElementById('ts_switch_fullscreen_button');
+var strokes_data = [ ];
+var redo_stack = [ ];
+var color = pen1_color;
+var current_tool = 'pen'; // 'pen', 'highlighter', or 'eraser'
+wrapper.onselectstart = function() { return false; };
+function manage_active_button(clicked_button) {
+    var color_buttons = document.getElementsByClassName('color-button');
+    for (var i = 0; i < color_buttons.length; i++) {
+        color_buttons[i].classList.remove('active');
+    }
+    clicked_button.classList.add('active');
+}
+function set_pen_color(new_color, clicked_button) {
+    current_tool = 'pen';
+    color = new_color;
+    manage_active_button(clicked_button);
+}
+function set_highlighter_tool(clicked_button) {
+    current_tool = 'highlighter';
+    manage_active_button(clicked_button);
+}
+function set_eraser_tool(clicked_button) {
+    current_tool = 'eraser';
+    manage_active_button(clicked_button);
+}
+function switch_small_canvas()
+{
+    stop_drawing();
+    small_canvas = !small_canvas;
+    if(!small_canvas)
+    {
+        ts_switch_fullscreen_button.className = 'active';
+    }
+    else{
+        ts_switch_fullscreen_button.className = '';
+    }
+    resize();
+}
+function switch_visibility()
+{
+	stop_drawing();
+    if (visible)
+    {
+        pen_canvas.style.display='none';
+        highlighter_canvas.style.display='none';
+        live_canvas.style.display='none';
+        ts_visibility_button.className = '';
+        optionBar.className = 'touch_disable';
+    }
+    else
+    {
+        pen_canvas.style.display='block';
+        highlighter_canvas.style.display='block';
+        live_canvas.style.display='block';
+        ts_visibility_button.className = 'active';
+        optionBar.className = '';
+    }
+    visible = !visible;
+}
+function listen_to_canvases() {
+    pen_canvas.onselectstart = function() { return false; };
+    highlighter_canvas.onselectstart = function() { return false; };
+    pen_canvas.addEventListener("pointerdown", pointerDownLine);
+    pen_canvas.addEventListener("pointermove", pointerMoveLine);
+}
+listen_to_canvases();
+window.addEventListener("pointerup", pointerUpLine);
+// In the default mode (neither small canvas nor follow) the ink scrolls with
+// the card, but the canvases only cover a window of whole tile rows around the
+// viewport instead of the card's full height, which on a long card and a
+// HiDPI screen can cost hundreds of megabytes or exceed the canvas size limit.
+// Strokes stay in card coordinates: the canvases sit at canvas_origin_y inside
+// the card and every context is translated by it. Scrolling past the window
+// moves it by whole tiles: the rows both windows share are shifted in place
+// and only the newly exposed rows go through the dirty rect path.
+var CANVAS_TILE_SIZE = 512;
+var canvas_windowed = false;
+var canvas_origin_y = 0;
+var canvas_window_height = 0;
+var canvas_card_height = 0;
+function canvas_window_origin() {
+    var top = Math.floor(window.scrollY / CANVAS_TILE_SIZE) * CANVAS_TILE_SIZE - CANVAS_TILE_SIZE;
+    return Math.max(0, Math.min(top, canvas_card_height - canvas_window_height));
+}
+function apply_canvas_transform(ctx) {
+    var dpr = window.devicePixelRatio || 1;
+    ctx.setTransform(dpr, 0, 0, dpr, 0, -canvas_origin_y * dpr);
+    ctx.lineJoin = 'round';
+}
+function place_canvases() {
+    [pen_canvas, highlighter_canvas, live_canvas].forEach(function(canvas) {
+        canvas.style.top = canvas_windowed ? canvas_origin_y + 'px' : '';
+    });
+    [pen_ctx, highlighter_ctx, live_ctx].forEach(apply_canvas_transform);
+}
+function stroke_in_canvas_window(stroke) {
+    return !canvas_windowed || !stroke.bbox ||
+        (stroke.bbox.max_y >= canvas_origin_y && stroke.bbox.min_y <= canvas_origin_y + canvas_window_height);
+}
+function update_canvas_window() {
+    if (!canvas_windowed || live_stroke) return;
+    var top = window.scrollY;
+    var bottom = top + document.documentElement.clientHeight;
+    if (top >= canvas_origin_y && bottom <= canvas_origin_y + canvas_window_height) return;
+    var old_origin_y = canvas_origin_y;
+    canvas_origin_y = canvas_window_origin();
+    if (canvas_origin_y === old_origin_y) return;
+    place_canvases();
+    scroll_layers(old_origin_y);
+}
+// Moves what the layers show from a window at old_origin_y to the current one.
+// A move that does not land on whole device pixels, or shares no rows with
+// the old window, rebuilds the layers from their checkpoints instead.
+function scroll_layers(old_origin_y) {
+    var dpr = window.devicePixelRatio || 1;
+    var delta = canvas_origin_y - old_origin_y;
+    var shift = delta * dpr;
+    if (Math.abs(delta) >= canvas_window_height || shift !== Math.round(shift)) {
+        for (var tool in layers) {
+            invalidate_layer(tool, 'scroll');
+        }
+        return;
+    }
+    var width = pen_ctx.canvas.width / dpr;
+    var strip = delta > 0 ?
+        {min_x: 0, min_y: old_origin_y + canvas_window_height, max_x: width, max_y: canvas_origin_y + canvas_window_height} :
+        {min_x: 0, min_y: canvas_origin_y, max_x: width, max_y: old_origin_y};
+    for (var tool in layers) {
+        if (layers[tool].dirty) continue;
+        shift_canvas(layers[tool].ctx, -shift);
+        invalidate_rect(tool, strip, 'scroll');
+    }
+}
+// Moves a canvas's pixels dy device pixels down; the rows left uncovered are
+// repainted by the caller.
+function shift_canvas(ctx, dy) {
+    ctx.save();
+    ctx.setTransform(1, 0, 0, 1, 0, 0);
+    ctx.globalCompositeOperation = 'copy';
+    ctx.drawImage(ctx.canvas, 0, dy);
+    ctx.restore();
+}
+window.addEventListener('scroll', update_canvas_window, {passive: true});
+// Sizing follows the card: a ResizeObserver on the card and the document (and
+// window resizes) request a resize, which runs at most once per animation
+// frame. A resize that leaves the canvases as they are touches nothing, and
+// one where only the height grows keeps the pixels already drawn and paints
+// just the new strip, instead of clearing the bitmap and replaying every stroke.
+var canvas_size = null;
+var resize_requested = false;
+var observed_card = null;
+var size_observer = window.ResizeObserver ? new ResizeObserver(request_resize) : null;
+function request_resize() {
+    resize_requested = true;
+    request_frame('resize');
+}
+function observe_card(card) {
+    if (!size_observer || card === observed_card) return;
+    if (observed_card) size_observer.unobserve(observed_card);
+    size_observer.observe(card);
+    observed_card = card;
+}
+function keep_canvas_window_origin() {
+    var top = window.scrollY;
+    var bottom = top + document.documentElement.clientHeight;
+    return top >= canvas_origin_y && bottom <= canvas_origin_y + canvas_window_height &&
+        canvas_origin_y + canvas_window_height <= canvas_card_height;
+}
+function grow_canvas_height(ctx, height) {
+    var scratch_ctx = create_layer_ctx(ctx);
+    scratch_ctx.canvas.width = ctx.canvas.width;
+    scratch_ctx.canvas.height = ctx.canvas.height;
+    copy_canvas(scratch_ctx, ctx.canvas);
+    ctx.canvas.height = height;
+    copy_canvas(ctx, scratch_ctx.canvas);
+    release_layer_ctx(scratch_ctx);
+}
+function resize() {
+    var card = document.getElementsByClassName('card')[0]
+    if (!card){
+        return;
+    }
+    observe_card(card);
+    canvas_wrapper.style.display='none';
+    pen_canvas.style["border-style"] = "none";
+    highlighter_canvas.style["border-style"] = "none";
+    document.documentElement.style.setProperty('--canvas-bar-pt', '0px');
+    document.documentElement.style.setProperty('--canvas-bar-pr', '0px');
+    document.documentElement.style.setProperty('--canvas-bar-pb', 'unset');
+    document.documentElement.style.setProperty('--canvas-bar-pl', 'unset');
+    document.documentElement.style.setProperty('--canvas-bar-position', 'absolute');
+    var target_width, target_height;
+    var was_windowed = canvas_windowed;
+    var old_origin_y = canvas_origin_y;
+    canvas_windowed = !small_canvas && !fullscreen_follow;
+    canvas_origin_y = 0;
+    if(canvas_windowed){
+        target_width = Math.max(card.scrollWidth, document.documentElement.clientWidth);
+        canvas_card_height = Math.max(document.documentElement.scrollHeight, document.documentElement.clientHeight);
+        canvas_window_height = Math.min(canvas_card_height,
+            (Math.ceil(document.documentElement.clientHeight / CANVAS_TILE_SIZE) + 2) * CANVAS_TILE_SIZE);
+        canvas_origin_y = old_origin_y;
+        if (!was_windowed || !keep_canvas_window_origin()) {
+            canvas_origin_y = canvas_window_origin();
+        }
+        target_height = canvas_window_height;
+    }
+    else if(small_canvas){
+        target_width = Math.min(document.documentElement.clientWidth,
+        getComputedStyle(document.documentElement).getPropertyValue('--small-canvas-width'));
+        target_height = Math.min(document.documentElement.clientHeight,
+        getComputedStyle(document.documentElement).getPropertyValue('--small-canvas-height'));
+        pen_canvas.style["border-style"] = "dashed";
+        highlighter_canvas.style["border-style"] = "dashed";
+        document.documentElement.style.setProperty('--canvas-bar-pt',
+        getComputedStyle(document.documentElement).getPropertyValue('--button-bar-pt'));
+        document.documentElement.style.setProperty('--canvas-bar-pr',
+        getComputedStyle(document.documentElement).getPropertyValue('--button-bar-pr'));
+        document.documentElement.style.setProperty('--canvas-bar-pb',
+        getComputedStyle(document.documentElement).getPropertyValue('--button-bar-pb'));
+        document.documentElement.style.setProperty('--canvas-bar-pl',
+        getComputedStyle(document.documentElement).getPropertyValue('--button-bar-pl'));
+        document.documentElement.style.setProperty('--canvas-bar-position', 'fixed');
+    }
+    else{
+        document.documentElement.style.setProperty('--canvas-bar-position', 'fixed');
+        target_width = document.documentElement.clientWidth-1;
+        target_height = document.documentElement.clientHeight-1;
+    }
+    canvas_wrapper.style.display='block';
+    var dpr = window.devicePixelRatio || 1;
+    var size = {
+        width: Math.floor(Math.floor(target_width) * dpr),
+        height: Math.floor(Math.floor(target_height) * dpr),
+        dpr: dpr,
+        origin_y: canvas_origin_y,
+        windowed: canvas_windowed
+    };
+    var old_size = canvas_size;
+    canvas_size = size;
+    var same_layout = old_size && old_size.width === size.width && old_size.dpr === size.dpr &&
+        old_size.origin_y === size.origin_y && old_size.windowed === size.windowed;
+    if (same_layout && old_size.height === size.height) {
+        return;
+    }
+    [pen_canvas, highlighter_canvas, live_canvas].forEach(function(canvas) {
+        canvas.style.width = target_width + 'px';
+        canvas.style.height = target_height + 'px';
+    });
+    if (same_layout && old_size.height < size.height) {
+        [pen_ctx, highlighter_ctx, live_ctx].forEach(function(ctx) {
+            grow_canvas_height(ctx, size.height);
+        });
+        place_canvases();
+        drop_all_checkpoints();
+        var strip = {min_x: 0, min_y: canvas_origin_y + old_size.height / dpr,
+            max_x: size.width / dpr, max_y: canvas_origin_y + size.height / dpr};
+        for (var tool in layers) {
+            invalidate_rect(tool, strip, 'resize');
+        }
+        return;
+    }
+    [pen_ctx, highlighter_ctx, live_ctx].forEach(function(ctx) {
+        ctx.canvas.width = size.width;
+        ctx.canvas.height = size.height;
+    });
+    place_canvases();
+    live_next_point = 0;
+    ts_redraw('resize');
+}
+window.addEventListener('resize', request_resize);
+window.addEventListener('load', request_resize);
+if (size_observer) {
+    size_observer.observe(document.documentElement);
+}
+// Settings changed from the add-on menu arrive here (only the values that
+// changed) instead of through a reviewer reload, so the drawing survives.
+function apply_settings(css_vars, values) {
+    for (var name in css_vars) {
+        document.documentElement.style.setProperty(name, css_vars[name]);
+    }
+    var pen1_button = document.getElementById('ts_pen1_button');
+    var pen2_button = document.getElementById('ts_pen2_button');
+    if ('pen1_color' in values) {
+        pen1_color = values.pen1_color;
+        pen1_button.style.color = pen1_color;
+        if (current_tool === 'pen' && pen1_button.classList.contains('active')) color = pen1_color;
+    }
+    if ('pen2_color' in values) {
+        pen2_color = values.pen2_color;
+        pen2_button.style.color = pen2_color;
+        if (current_tool === 'pen' && pen2_button.classList.contains('active')) color = pen2_color;
+    }
+    if ('line_width' in values) line_width = values.line_width;
+    if ('simplify_tolerance' in values) simplify_tolerance = values.simplify_tolerance;
+    if ('coalesced_input' in values) coalesced_input = values.coalesced_input;
+    if ('precise_eraser' in values) precise_eraser = values.precise_eraser;
+    if ('fullscreen_follow' in values) fullscreen_follow = values.fullscreen_follow;
+    if ('diagnostics' in values) set_diagnostics(values.diagnostics);
+    if ('small_canvas' in values && values.small_canvas !== small_canvas) {
+        switch_small_canvas();
+    } else if ('fullscreen_follow' in values || Object.keys(css_vars).length) {
+        resize();
+    }
+}
+var isPointerDown = false;
+function ts_undo(){
+    stop_drawing();
+    if (strokes_data.length < 1) return;
+    
+    var undone_stroke = strokes_data.pop();
+    redo_stack.push(undone_stroke);
+    unindex_stroke(undone_stroke);
+    cancel_erase(undone_stroke);
+    for (var tool in layers) {
+        drop_checkpoints(layers[tool], strokes_data.length);
+    }
+
+    if (undone_stroke.tool === 'eraser' && undone_stroke.splits) {
+        for (var i = undone_stroke.splits.length - 1; i >= 0; i--) {
+            revert_split(undone_stroke.splits[i]);
+        }
+    }
+    if (undone_stroke.tool === 'eraser' && undone_stroke.erasedIndices) {
+        undone_stroke.erasedIndices.forEach(function(index) {
+            if (strokes_data[index]) {
+                set_stroke_visible(index, true, 'undo');
+            }
+        });
+    } else if (undone_stroke.tool !== 'eraser') {
+        uncommit_stroke(undone_stroke, strokes_data.length);
+        forget_remote_path(undone_stroke);
+    }
+
+    restore_raw_points(undone_stroke);
+    ts_redo_button.className = "active";
+    if (strokes_data.length === 0) {
+        ts_undo_button.className = "";
+    }
+    schedule_ink_save();
+}
+function ts_redo() {
+    stop_drawing();
+    if (redo_stack.length < 1) return;
+    
+    var redone_stroke = redo_stack.pop();
+    strokes_data.push(redone_stroke);
+    restore_simplified_points(redone_stroke);
+    index_stroke(redone_stroke);
+
+    if (redone_stroke.tool === 'eraser' && redone_stroke.erase_incomplete) {
+        erase_with(redone_stroke);
+    } else if (redone_stroke.tool === 'eraser') {
+        redone_stroke.splits.forEach(apply_split);
+        redone_stroke.erasedIndices.forEach(function(index) {
+            if (strokes_data[index]) {
+                set_stroke_visible(index, false, 'redo');
+            }
+        });
+    } else {
+        commit_stroke(redone_stroke, strokes_data.length - 1);
+    }
+
+    ts_undo_button.className = "active";
+    if (redo_stack.length === 0) {
+        ts_redo_button.className = "";
+    }
+    schedule_ink_save();
+}
+function ts_redraw(reason) {
+    drop_all_checkpoints();
+    invalidate_layer('pen', reason);
+    invalidate_layer('highlighter', reason);
+}
+function clear_canvas()
+{
+	stop_drawing();
+    strokes_data = [];
+    redo_stack = [];
+    clear_stroke_index();
+    forget_remote_paths();
+    ts_redo_button.className = "";
+    ts_undo_button.className = "";
+	ts_redraw('clear');
+    schedule_ink_save();
+}
+// Drawings are saved per card on the Python side. ink_card_id is the card the
+// page's strokes belong to (null until Python loads one); every change is sent
+// back through pycmd, debounced, encoded with ink_codec.js as base64.
+var ink_card_id = null;
+var ink_save_timer = null;
+var INK_SAVE_DELAY_MS = 1000;
+// The strokes that make up the drawing: erased and undone ones are left out.
+function export_strokes() {
+    return strokes_data.filter(function(stroke) {
+        return stroke.tool !== 'eraser' && stroke.visible !== false && stroke !== live_stroke;
+    });
+}
+function encoded_drawing() {
+    return bytes_to_base64(encode_drawing(export_strokes()));
+}
+function schedule_ink_save() {
+    if (ink_card_id === null) return;
+    clearTimeout(ink_save_timer);
+    ink_save_timer = setTimeout(flush_ink_save, INK_SAVE_DELAY_MS);
+}
+function flush_ink_save() {
+    if (ink_save_timer === null) return;
+    clearTimeout(ink_save_timer);
+    ink_save_timer = null;
+    pycmd('AnkiPenDown:ink:' + ink_card_id + ':' + encoded_drawing());
+}
+// drawing is the card's saved drawing as base64, or null for none.
+function load_card_drawing(card_id, drawing) {
+    stop_drawing();
+    flush_ink_save();
+    strokes_data = drawing ? decode_drawing(base64_to_bytes(drawing)) : [];
+    redo_stack = [];
+    clear_stroke_index();
+    forget_remote_paths();
+    strokes_data.forEach(index_stroke);
+    ink_card_id = card_id;
+    ts_redo_button.className = "";
+    ts_undo_button.className = strokes_data.length ? "active" : "";
+    ts_redraw('load');
+}
+function stop_drawing() {
+    finish_live_stroke();
+	isPointerDown = false;
+	drawingWithPressurePenOnly = false;
+    update_canvas_window();
+}
+function start_drawing() {
+    ts_undo_button.className = "active"
+    isPointerDown = true;
+    request_frame('pointer');
+}
+// Frames are only requested while there is something to draw: a moving
+// pointer, a layer that needs rebuilding, a resize. When none of that is
+// pending no animation frame is scheduled at all. With diagnostics on, the
+// reasons a frame was requested for are counted once per frame.
+var frame_requested = false;
+var frame_reasons = new Set();
+// Commands from Python arrive in batches, one eval per turn of its event loop
+// (execute_js() in __init__.py), and run together at the start of the next
+// animation frame, before it draws, so whatever they request is drawn in that
+// same frame. An urgent batch runs right away.
+var bridge_commands = [];
+function run_bridge_commands(commands, urgent) {
+    bridge_commands.push.apply(bridge_commands, commands);
+    if (urgent) {
+        run_bridge_commands_now();
+    } else {
+        request_frame('bridge');
+    }
+}
+function run_bridge_commands_now() {
+    var commands = bridge_commands;
+    bridge_commands = [];
+    commands.forEach(function(command) {
+        try {
+            command();
+        } catch (e) {
+            console.error(e);
+        }
+    });
+}
+function request_frame(reason) {
+    if (diagnostics) {
+        frame_reasons.add(reason);
+    }
+    if (!frame_requested) {
+        frame_requested = true;
+        window.requestAnimationFrame(run_frame);
+    }
+}
+function run_frame() {
+    if (bridge_commands.length) {
+        run_bridge_commands_now();
+    }
+    frame_requested = false;
+    if (frame_reasons.size) {
+        frame_reasons.forEach(count_frame_reason);
+        frame_reasons.clear();
+    }
+    if (resize_requested) {
+        resize_requested = false;
+        resize();
+    }
+    if (!diagnostics) {
+        draw_upto_latest_point_async();
+        return;
+    }
+    var start = performance.now();
+    draw_upto_latest_point_async();
+    var end = performance.now();
+    record_histogram(diagnostic_stats.draw, end - start);
+    if (diagnostic_input_time !== null) {
+        record_histogram(diagnostic_stats.latency, end - diagnostic_input_time);
+        diagnostic_input_time = null;
+    }
+}
+// With the diagnostics setting on, the page keeps fixed-size histograms of the
+// time from a pointer event to the end of the frame that draws it, of every
+// drawing pass, and of eraser queries, and counts full layer rebuilds and the
+// frames requested for each reason (see request_frame()). A small
+// HUD shows them; clicking it (or "Log drawing diagnostics" in the add-on
+// menu) sends a summary to Python, which writes it to the log. With the
+// setting off nothing is measured.
+var DIAGNOSTIC_BUCKETS_MS = [0.5, 1, 2, 4, 8, 12, 16, 24, 33, 50, 100, 250, 500];
+var DIAGNOSTICS_HUD_INTERVAL_MS = 500;
+var diagnostic_stats = new_diagnostic_stats();
+var diagnostic_input_time = null;
+var diagnostics_hud = null;
+var diagnostics_hud_timer = null;
+function new_histogram() {
+    return {counts: new Uint32Array(DIAGNOSTIC_BUCKETS_MS.length + 1), count: 0, sum: 0, max: 0};
+}
+function new_diagnostic_stats() {
+    return {latency: new_histogram(), draw: new_histogram(), erase: new_histogram(), full_redraws: 0,
+            frame_reasons: {}};
+}
+function count_frame_reason(reason) {
+    diagnostic_stats.frame_reasons[reason] = (diagnostic_stats.frame_reasons[reason] || 0) + 1;
+}
+function record_histogram(histogram, ms) {
+    var bucket = 0;
+    while (bucket < DIAGNOSTIC_BUCKETS_MS.length && ms > DIAGNOSTIC_BUCKETS_MS[bucket]) {
+        bucket++;
+    }
+    histogram.counts[bucket]++;
+    histogram.count++;
+    histogram.sum += ms;
+    histogram.max = Math.max(histogram.max, ms);
+    schedule_diagnostics_hud();
+}
+// The upper bound of the bucket quantile q falls in, capped by the maximum.
+function histogram_quantile(histogram, q) {
+    var seen = 0;
+    for (var i = 0; i < histogram.counts.length; i++) {
+        seen += histogram.counts[i];
+        if (seen > 0 && seen >= q * histogram.count) {
+            return i < DIAGNOSTIC_BUCKETS_MS.length ? Math.min(DIAGNOSTIC_BUCKETS_MS[i], histogram.max) : histogram.max;
+        }
+    }
+    return 0;
+}
+function summarize_histogram(histogram) {
+    return {
+        count: histogram.count,
+        mean: histogram.count ? histogram.sum / histogram.count : 0,
+        p50: histogram_quantile(histogram, 0.5),
+        p95: histogram_quantile(histogram, 0.95),
+        max: histogram.max,
+        counts: Array.from(histogram.counts)
+    };
+}
+function diagnostics_summary() {
+    return {
+        latency_ms: summarize_histogram(diagnostic_stats.latency),
+        draw_ms: summarize_histogram(diagnostic_stats.draw),
+        erase_ms: summarize_histogram(diagnostic_stats.erase),
+        full_redraws: diagnostic_stats.full_redraws,
+        frame_reasons: diagnostic_stats.frame_reasons,
+        bucket_bounds_ms: DIAGNOSTIC_BUCKETS_MS,
+        render_worker: !!render_worker,
+        eraser_worker: !!eraser_worker,
+        strokes: strokes_data.length
+    };
+}
+function send_diagnostics() {
+    pycmd('AnkiPenDown:diag:' + JSON.stringify(diagnostics_summary()));
+}
+function note_input_time(e) {
+    if (diagnostics && diagnostic_input_time === null) {
+        diagnostic_input_time = e.timeStamp;
+    }
+}
+function timed_erase_callback(callback) {
+    var start = performance.now();
+    return function(hits) {
+        record_histogram(diagnostic_stats.erase, performance.now() - start);
+        callback(hits);
+    };
+}
+function schedule_diagnostics_hud() {
+    if (diagnostics_hud_timer === null) {
+        diagnostics_hud_timer = setTimeout(render_diagnostics_hud, DIAGNOSTICS_HUD_INTERVAL_MS);
+    }
+}
+function render_diagnostics_hud() {
+    diagnostics_hud_timer = null;
+    if (!diagnostics) return;
+    if (!diagnostics_hud) {
+        diagnostics_hud = document.createElement('div');
+        diagnostics_hud.id = 'pendown_diagnostics';
+        diagnostics_hud.title = 'Click to log a summary';
+        diagnostics_hud.onclick = send_diagnostics;
+        wrapper.appendChild(diagnostics_hud);
+    }
+    function line(label, histogram) {
+        return label + ' p50 ' + histogram_quantile(histogram, 0.5).toFixed(1) +
+            ' p95 ' + histogram_quantile(histogram, 0.95).toFixed(1) +
+            ' max ' + histogram.max.toFixed(1) + ' ms (' + histogram.count + ')';
+    }
+    diagnostics_hud.textContent = [
+        line('input', diagnostic_stats.latency),
+        line('draw ', diagnostic_stats.draw),
+        line('erase', diagnostic_stats.erase),
+        'full redraws ' + diagnostic_stats.full_redraws,
+        'frames ' + Object.keys(diagnostic_stats.frame_reasons).map(function(reason) {
+            return reason + ' ' + diagnostic_stats.frame_reasons[reason];
+        }).join(', ')
+    ].join('\n');
+    diagnostics_hud.style.display = '';
+}
+function set_diagnostics(on) {
+    diagnostics = on;
+    diagnostic_input_time = null;
+    if (diagnostics) {
+        render_diagnostics_hud();
+    } else if (diagnostics_hud) {
+        diagnostics_hud.style.display = 'none';
+    }
+}
+// Committed strokes are rasterized once into one layer per tool, and the
+// stroke being drawn lives on live_canvas until it is committed. Undo, redo
+// and erasing do not repaint a whole layer: they add the bounding boxes of the
+// strokes they touch to the layer's dirty_rect, and the next frame clears just
+// that rect and repaints the strokes overlapping it, clipped to it. Only when
+// the rect covers most of the layer is the layer rebuilt instead.
+var DIRTY_RECT_MAX_FRACTION = 0.5;
+var layers = {
+    pen: {ctx: pen_ctx, dirty: true, dirty_rect: null, checkpoints: [], since_checkpoint: 0},
+    highlighter: {ctx: highlighter_ctx, dirty: true, dirty_rect: null, checkpoints: [], since_checkpoint: 0}
+};
+// Every CHECKPOINT_INTERVAL strokes a layer also keeps a raster checkpoint:
+// the layer as it was before strokes_data[upto]. Rebuilding a layer restores
+// the newest checkpoint that is still valid and replays only the strokes
+// after it, so its cost does not grow with the drawing. A checkpoint goes
+// stale once a stroke before its upto changes visibility or is undone. On a
+// long card each checkpoint belongs to the canvas window it was taken in, and
+// is kept when the window scrolls so it can be used again on the way back.
+// All checkpoints share CHECKPOINT_BUDGET_BYTES; those of other windows are
+// evicted first, then the oldest.
+var CHECKPOINT_INTERVAL = 16;
+var CHECKPOINT_BUDGET_BYTES = 96 * 1024 * 1024;
+var checkpoint_bytes = 0;
+function take_checkpoint(layer, upto) {
+    var canvas = layer.ctx.canvas;
+    var bytes = canvas.width * canvas.height * 4;
+    layer.since_checkpoint = 0;
+    if (bytes === 0 || bytes > CHECKPOINT_BUDGET_BYTES) return;
+    var position = layer.checkpoints.length;
+    while (position > 0 && layer.checkpoints[position - 1].upto >= upto) {
+        if (layer.checkpoints[position - 1].upto === upto &&
+                layer.checkpoints[position - 1].origin_y === canvas_origin_y) return;
+        position--;
+    }
+    var ctx = create_layer_ctx(layer.ctx);
+    ctx.canvas.width = canvas.width;
+    ctx.canvas.height = canvas.height;
+    copy_canvas(ctx, canvas);
+    layer.checkpoints.splice(position, 0, {upto: upto, ctx: ctx, bytes: bytes, origin_y: canvas_origin_y});
+    checkpoint_bytes += bytes;
+    while (checkpoint_bytes > CHECKPOINT_BUDGET_BYTES) {
+        release_checkpoint(evict_checkpoint());
+    }
+}
+function evict_checkpoint() {
+    var victim = null;
+    for (var tool in layers) {
+        layers[tool].checkpoints.forEach(function(checkpoint, index) {
+            var elsewhere = checkpoint.origin_y !== canvas_origin_y;
+            if (!victim || elsewhere > victim.elsewhere ||
+                    (elsewhere === victim.elsewhere && checkpoint.upto < victim.checkpoint.upto)) {
+                victim = {layer: layers[tool], index: index, checkpoint: checkpoint, elsewhere: elsewhere};
+            }
+        });
+    }
+    victim.layer.checkpoints.splice(victim.index, 1);
+    return victim.checkpoint;
+}
+function release_checkpoint(checkpoint) {
+    checkpoint_bytes -= checkpoint.bytes;
+    release_layer_ctx(checkpoint.ctx);
+}
+// Drops the checkpoints of a layer that include strokes_data[from] or later.
+function drop_checkpoints(layer, from) {
+    while (layer.checkpoints.length && layer.checkpoints[layer.checkpoints.length - 1].upto > from) {
+        release_checkpoint(layer.checkpoints.pop());
+    }
+}
+function drop_all_checkpoints() {
+    for (var tool in layers) {
+        drop_checkpoints(layers[tool], -1);
+    }
+}
+function restore_checkpoint(layer, upto) {
+    var canvas = layer.ctx.canvas;
+    for (var i = layer.checkpoints.length - 1; i >= 0; i--) {
+        var checkpoint = layer.checkpoints[i];
+        if (checkpoint.upto > upto) continue;
+        if (checkpoint.ctx.canvas.width !== canvas.width || checkpoint.ctx.canvas.height !== canvas.height) {
+            drop_checkpoints(layer, -1);
+            break;
+        }
+        if (checkpoint.origin_y !== canvas_origin_y) continue;
+        copy_canvas(layer.ctx, checkpoint.ctx.canvas);
+        return checkpoint.upto;
+    }
+    clear_ctx(layer.ctx);
+    return 0;
+}
+// Shows or hides a committed stroke, invalidating what was rasterized with it.
+function set_stroke_visible(index, visible, reason) {
+    var stroke = strokes_data[index];
+    stroke.visible = visible;
+    index_stroke_visibility(stroke);
+    if (!visible) {
+        forget_remote_path(stroke);
+    }
+    if (layers[stroke.tool]) {
+        drop_checkpoints(layers[stroke.tool], index);
+        invalidate_rect(stroke.tool, stroke.bbox, reason);
+    }
+}
+var live_stroke = null;
+var live_next_point = 0;
+function copy_canvas(dst_ctx, src_canvas) {
+    dst_ctx.save();
+    dst_ctx.setTransform(1, 0, 0, 1, 0, 0);
+    dst_ctx.globalCompositeOperation = 'copy';
+    dst_ctx.drawImage(src_canvas, 0, 0);
+    dst_ctx.restore();
+}
+function clear_ctx(ctx) {
+    ctx.save();
+    ctx.setTransform(1, 0, 0, 1, 0, 0);
+    ctx.clearRect(0, 0, ctx.canvas.width, ctx.canvas.height);
+    ctx.restore();
+}
+function invalidate_layer(tool, reason) {
+    if (layers[tool]) {
+        layers[tool].dirty = true;
+        layers[tool].dirty_rect = null;
+        request_frame(reason || 'redraw');
+    }
+}
+// Marks rect (card coordinates) for repainting, widened by a pixel for the
+// antialiased edge. Without a rect the whole layer is invalidated.
+function invalidate_rect(tool, rect, reason) {
+    var layer = layers[tool];
+    if (!layer) return;
+    if (!rect) {
+        invalidate_layer(tool, reason);
+        return;
+    }
+    if (layer.dirty) return;
+    var dirty = layer.dirty_rect;
+    layer.dirty_rect = {
+        min_x: Math.min(rect.min_x - 1, dirty ? dirty.min_x : Infinity),
+        min_y: Math.min(rect.min_y - 1, dirty ? dirty.min_y : Infinity),
+        max_x: Math.max(rect.max_x + 1, dirty ? dirty.max_x : -Infinity),
+        max_y: Math.max(rect.max_y + 1, dirty ? dirty.max_y : -Infinity)
+    };
+    request_frame(reason || 'redraw');
+}
+function commit_stroke(stroke, index) {
+    var layer = layers[stroke.tool];
+    if (!layer || layer.dirty) return;
+    if (layer.since_checkpoint >= CHECKPOINT_INTERVAL) {
+        take_checkpoint(layer, index);
+    }
+    layer.since_checkpoint++;
+    paint_stroke(layer.ctx, stroke);
+}
+function uncommit_stroke(stroke, index) {
+    var layer = layers[stroke.tool];
+    if (!layer || layer.dirty) return;
+    layer.since_checkpoint = Math.max(0, layer.since_checkpoint - 1);
+    invalidate_rect(stroke.tool, stroke.bbox, 'undo');
+}
+function rebuild_layer(tool) {
+    var layer = layers[tool];
+    if (diagnostics) {
+        diagnostic_stats.full_redraws++;
+    }
+    var count = strokes_data.length;
+    if (live_stroke && strokes_data[count - 1] === live_stroke) {
+        count--;
+    }
+    layer.since_checkpoint = 0;
+    for (var i = restore_checkpoint(layer, count); i < count; i++) {
+        var stroke = strokes_data[i];
+        if (stroke.tool === tool && stroke.visible !== false) {
+            if (layer.since_checkpoint >= CHECKPOINT_INTERVAL) {
+                take_checkpoint(layer, i);
+            }
+            layer.since_checkpoint++;
+            if (stroke_in_canvas_window(stroke)) {
+                paint_stroke(layer.ctx, stroke);
+            }
+        }
+    }
+    layer.dirty = false;
+    layer.dirty_rect = null;
+}
+// Clears rect on a layer and repaints the visible strokes overlapping it, in
+// order, clipped to it. The rect is widened to whole device pixels so the
+// clip has no antialiased seam.
+function repaint_layer_region(tool, rect) {
+    var layer = layers[tool];
+    var dpr = window.devicePixelRatio || 1;
+    var x0 = Math.floor(rect.min_x * dpr) / dpr;
+    var y0 = Math.floor(rect.min_y * dpr) / dpr;
+    var x1 = Math.ceil(rect.max_x * dpr) / dpr;
+    var y1 = Math.ceil(rect.max_y * dpr) / dpr;
+    var ctx = layer.ctx;
+    ctx.save();
+    ctx.beginPath();
+    ctx.rect(x0, y0, x1 - x0, y1 - y0);
+    ctx.clip();
+    ctx.clearRect(x0, y0, x1 - x0, y1 - y0);
+    for (var i = 0; i < strokes_data.length; i++) {
+        var stroke = strokes_data[i];
+        if (stroke.tool !== tool || stroke.visible === false || stroke === live_stroke || !stroke.bbox) continue;
+        if (stroke.bbox.max_x < x0 || stroke.bbox.min_x > x1 || stroke.bbox.max_y < y0 || stroke.bbox.min_y > y1) continue;
+        paint_stroke(ctx, stroke);
+    }
+    ctx.restore();
+}
+// Repaints a layer's dirty rect, or rebuilds the layer when the rect covers
+// most of what the canvas shows.
+function repaint_dirty_rect(tool) {
+    var layer = layers[tool];
+    var rect = layer.dirty_rect;
+    layer.dirty_rect = null;
+    var dpr = window.devicePixelRatio || 1;
+    var width = layer.ctx.canvas.width / dpr;
+    var height = layer.ctx.canvas.height / dpr;
+    var visible_width = Math.min(rect.max_x, width) - Math.max(rect.min_x, 0);
+    var visible_height = Math.min(rect.max_y, canvas_origin_y + height) - Math.max(rect.min_y, canvas_origin_y);
+    if (visible_width <= 0 || visible_height <= 0) return;
+    if (visible_width * visible_height > DIRTY_RECT_MAX_FRACTION * width * height) {
+        rebuild_layer(tool);
+    } else {
+        repaint_layer_region(tool, rect);
+    }
+}
+function finish_live_stroke() {
+    var stroke = live_stroke;
+    if (!stroke) return;
+    live_stroke = null;
+    tip_rect = null;
+    clear_live_segments();
+    predicted_points.length = 0;
+    clear_ctx(live_ctx);
+    trim_point_buffer(stroke.points);
+    simplify_stroke(stroke);
+    if (stroke.tool === 'eraser') {
+        // The eraser has been erasing all along; this tests the last samples.
+        erase_live(stroke);
+    } else {
+        index_stroke(stroke);
+        commit_stroke(stroke, strokes_data.indexOf(stroke));
+    }
+    schedule_ink_save();
+}
+// The stroke being drawn is stroked segment by segment at full opacity; the
+// live canvas itself carries the stroke's opacity, so a translucent
+// highlighter does not darken where its segments overlap.
+function apply_live_style(ctx, stroke) {
+    ctx.globalCompositeOperation = 'source-over';
+    ctx.strokeStyle = stroke.color;
+    ctx.lineJoin = 'round';
+    ctx.lineCap = (stroke.tool === 'highlighter') ? 'butt' : 'round';
+}
+function draw_path_at_some_point(active_ctx, startX, startY, midX, midY, endX, endY, lineWidth) {
+		active_ctx.beginPath();
+		active_ctx.moveTo((startX + (midX - startX) / 2), (startY + (midY - startY)/ 2));
+		active_ctx.quadraticCurveTo(midX, midY, (midX + (endX - midX) / 2), (midY + (endY - midY)/ 2));
+		active_ctx.lineWidth = lineWidth;
+		active_ctx.stroke();
+}
+function paint_stroke_points(active_ctx, stroke, startPoint, endPoint) {
+    var data = stroke.points.data;
+    var p1, p2, p3;
+    p2 = (startPoint > 1 ? startPoint-2 : 0) * POINT_STRIDE;
+    p3 = (startPoint > 0 ? startPoint-1 : 0) * POINT_STRIDE;
+    var end = endPoint === undefined ? stroke.points.length : endPoint;
+    for(var j = startPoint; j < end; j++){
+        p1 = p2;
+        p2 = p3;
+        p3 = j * POINT_STRIDE;
+        draw_path_at_some_point(active_ctx, data[p1],data[p1+1],data[p2],data[p2+1],data[p3],data[p3+1],data[p3+3]);
+    }
+}
+// The Path2D of a committed stroke (see build_stroke_path() in geometry.js)
+// is cached until the stroke's points change.
+function stroke_path(stroke) {
+    if (!stroke.path || stroke.path_points !== stroke.points) {
+        stroke.path = build_stroke_path(stroke);
+        stroke.path_points = stroke.points;
+    }
+    return stroke.path;
+}
+function paint_stroke(active_ctx, stroke) {
+    active_ctx.save();
+    active_ctx.globalCompositeOperation = 'source-over';
+    active_ctx.globalAlpha = stroke.opacity;
+    active_ctx.fillStyle = stroke.color;
+    active_ctx.fill(active_ctx.remote ? remote_stroke_path(stroke) : stroke_path(stroke));
+    active_ctx.restore();
+}
+var tip_rect = null;
+var tip_stroke = {points: new_point_buffer(16)};
+// The segments of the live stroke painted so far are binned into grid cells
+// (the segment paint_stroke_points() draws for point j stays inside the box
+// of points j-2..j, grown by half its width), so erasing the predicted tip
+// repaints just the segments under it, wherever in the stroke they are,
+// without a pass over the whole stroke every frame.
+var live_cells = new Map();
+var live_cells_stroke = null;
+var live_cells_upto = 0;
+var live_segment_box = {min_x: 0, min_y: 0, max_x: 0, max_y: 0};
+function update_live_segment_box(data, j) {
+    var r = data[j * POINT_STRIDE + 3] / 2 + 1;
+    var box = live_segment_box;
+    box.min_x = box.min_y = Infinity;
+    box.max_x = box.max_y = -Infinity;
+    for (var k = Math.max(0, j - 2); k <= j; k++) {
+        var o = k * POINT_STRIDE;
+        box.min_x = Math.min(box.min_x, data[o] - r); box.max_x = Math.max(box.max_x, data[o] + r);
+        box.min_y = Math.min(box.min_y, data[o + 1] - r); box.max_y = Math.max(box.max_y, data[o + 1] + r);
+    }
+    return box;
+}
+function index_live_segments(stroke) {
+    if (live_cells_stroke !== stroke) {
+        live_cells.clear();
+        live_cells_stroke = stroke;
+        live_cells_upto = 0;
+    }
+    var data = stroke.points.data;
+    for (var j = live_cells_upto; j < stroke.points.length; j++) {
+        var box = update_live_segment_box(data, j);
+        for_each_grid_cell(box.min_x, box.min_y, box.max_x, box.max_y, function(key) {
+            var cell = live_cells.get(key);
+            if (!cell) {
+                cell = [];
+                live_cells.set(key, cell);
+            }
+            cell.push(j);
+        });
+    }
+    live_cells_upto = stroke.points.length;
+}
+function clear_live_segments() {
+    live_cells.clear();
+    live_cells_stroke = null;
+    live_cells_upto = 0;
+}
+function erase_predicted_tip() {
+    if (!tip_rect) return;
+    live_ctx.clearRect(tip_rect.x, tip_rect.y, tip_rect.w, tip_rect.h);
+    if (live_stroke && live_cells_stroke === live_stroke) {
+        var data = live_stroke.points.data;
+        var rect = tip_rect;
+        var hits = new Set();
+        for_each_grid_cell(rect.x, rect.y, rect.x + rect.w, rect.y + rect.h, function(key) {
+            var cell = live_cells.get(key);
+            if (!cell) return;
+            cell.forEach(function(j) {
+                var box = update_live_segment_box(data, j);
+                if (box.max_x >= rect.x && box.min_x <= rect.x + rect.w &&
+                        box.max_y >= rect.y && box.min_y <= rect.y + rect.h) {
+                    hits.add(j);
+                }
+            });
+        });
+        live_ctx.save();
+        live_ctx.beginPath();
+        live_ctx.rect(tip_rect.x, tip_rect.y, tip_rect.w, tip_rect.h);
+        live_ctx.clip();
+        apply_live_style(live_ctx, live_stroke);
+        Array.from(hits).sort(function(a, b) { return a - b; }).forEach(function(j) {
+            paint_stroke_points(live_ctx, live_stroke, j, j + 1);
+        });
+        live_ctx.restore();
+    }
+    tip_rect = null;
+}
+function draw_predicted_tip() {
+    var count = live_stroke.points.length;
+    if (predicted_points.length === 0 || count === 0) return;
+    var data = live_stroke.points.data;
+    var tip = tip_stroke.points;
+    tip.length = 0;
+    for (var i = Math.max(0, count - 2); i < count; i++) {
+        var o = i * POINT_STRIDE;
+        push_point(tip, data[o], data[o + 1], data[o + 2], data[o + 3]);
+    }
+    var first_predicted = tip.length;
+    for (var i = 0; i < predicted_points.length; i++) {
+        var o = i * POINT_STRIDE;
+        push_point(tip, predicted_points.data[o], predicted_points.data[o + 1],
+            predicted_points.data[o + 2], predicted_points.data[o + 3]);
+    }
+    live_ctx.save();
+    apply_live_style(live_ctx, live_stroke);
+    paint_stroke_points(live_ctx, tip_stroke, first_predicted);
+    live_ctx.restore();
+    var bbox = update_stroke_bbox(tip_stroke);
+    tip_rect = {x: bbox.min_x - 2, y: bbox.min_y - 2, w: bbox.max_x - bbox.min_x + 4, h: bbox.max_y - bbox.min_y + 4};
+}
+async function draw_upto_latest_point_async(){
+    for (var tool in layers) {
+        if (layers[tool].dirty) {
+            rebuild_layer(tool);
+        } else if (layers[tool].dirty_rect) {
+            repaint_dirty_rect(tool);
+        }
+    }
+    erase_predicted_tip();
+    if (live_stroke && live_stroke.tool !== 'eraser' && live_next_point < live_stroke.points.length) {
+        live_ctx.save();
+        apply_live_style(live_ctx, live_stroke);
+        paint_stroke_points(live_ctx, live_stroke, live_next_point);
+        live_ctx.restore();
+        live_next_point = live_stroke.points.length;
+        index_live_segments(live_stroke);
+    }
+    if (live_stroke && live_stroke.tool !== 'eraser') {
+        draw_predicted_tip();
+    }
+}
+// Committed strokes are simplified with Ramer-Douglas-Peucker. A sample is
+// kept when it is farther than simplify_tolerance from the chord it would be
+// replaced by, or when its width differs by more than that from the width
+// interpolated along the chord, so pressure changes survive simplification.
+// The raw samples stay on the stroke for a while so an undo right after
+// drawing can hand back exactly what was drawn; the simplified points are
+// kept for a redo, so a stroke is only ever simplified once, when committed.
+var RAW_POINTS_TTL_MS = 10000;
+function simplify_points(points, tolerance) {
+    var count = points.length;
+    if (count < 3 || !(tolerance > 0)) return points;
+    var data = points.data;
+    var keep = new Uint8Array(count);
+    keep[0] = keep[count - 1] = 1;
+    var stack = [0, count - 1];
+    while (stack.length) {
+        var last = stack.pop();
+        var first = stack.pop();
+        var a = first * POINT_STRIDE, b = last * POINT_STRIDE;
+        var dx = data[b] - data[a], dy = data[b + 1] - data[a + 1];
+        var len_sq = dx * dx + dy * dy;
+        var worst = -1, worst_error = tolerance;
+        for (var i = first + 1; i < last; i++) {
+            var o = i * POINT_STRIDE;
+            var t = len_sq > 0 ? ((data[o] - data[a]) * dx + (data[o + 1] - data[a + 1]) * dy) / len_sq : 0;
+            t = Math.max(0, Math.min(1, t));
+            var ex = data[a] + t * dx - data[o], ey = data[a + 1] + t * dy - data[o + 1];
+            var width_error = Math.abs(data[a + 3] + t * (data[b + 3] - data[a + 3]) - data[o + 3]);
+            var error = Math.max(Math.sqrt(ex * ex + ey * ey), width_error);
+            if (error > worst_error) {
+                worst = i;
+                worst_error = error;
+            }
+        }
+        if (worst > 0) {
+            keep[worst] = 1;
+            stack.push(first, worst, worst, last);
+        }
+    }
+    var simplified = new_point_buffer(count);
+    for (var i = 0; i < count; i++) {
+        if (keep[i]) {
+            var o = i * POINT_STRIDE;
+            push_point(simplified, data[o], data[o + 1], data[o + 2], data[o + 3]);
+        }
+    }
+    trim_point_buffer(simplified);
+    return simplified;
+}
+// Eraser paths are kept as drawn: erase_live() counts their samples, and they
+// are never saved.
+function simplify_stroke(stroke) {
+    if (stroke.tool === 'eraser') return;
+    var raw = stroke.points;
+    var simplified = simplify_points(raw, parseFloat(simplify_tolerance));
+    if (simplified === raw) return;
+    console.debug('AnkiPenDown: simplified ' + stroke.tool + ' stroke from ' + raw.length +
+        ' to ' + simplified.length + ' points (tolerance ' + simplify_tolerance + ')');
+    stroke.points = simplified;
+    keep_raw_points(stroke, raw);
+}
+function keep_raw_points(stroke, raw) {
+    stroke.raw_points = raw;
+    clearTimeout(stroke.raw_points_timer);
+    stroke.raw_points_timer = setTimeout(function() { stroke.raw_points = null; }, RAW_POINTS_TTL_MS);
+}
+function restore_raw_points(stroke) {
+    if (!stroke.raw_points) return;
+    clearTimeout(stroke.raw_points_timer);
+    stroke.simplified_points = stroke.points;
+    stroke.points = stroke.raw_points;
+    stroke.raw_points = null;
+}
+function restore_simplified_points(stroke) {
+    if (!stroke.simplified_points) return;
+    var raw = stroke.points;
+    stroke.points = stroke.simplified_points;
+    stroke.simplified_points = null;
+    keep_raw_points(stroke, raw);
+}
+// Eraser hit-testing runs in a worker that mirrors every indexed stroke under
+// a stable id (see eraser_worker.js), so a big erase does not hold up input
+// and painting. query_erased() posts the eraser path and calls back with the
+// hit strokes once the worker answers. Without a worker (or once it fails) the
+// strokes are kept in stroke_grid and queries are answered right away.
+var stroke_grid = new Map();
+var strokes_by_id = new Map();
+var next_stroke_id = 1;
+var erase_queries = new Map();
+var next_erase_query = 1;
+var eraser_worker = start_eraser_worker();
+function start_eraser_worker() {
+    if (!window.Worker) return null;
+    var worker;
+    try {
+        worker = new Worker(pendown_web_base + 'eraser_worker.js?v=' + pendown_web_version);
+    } catch (e) {
+        return null;
+    }
+    worker.onmessage = on_eraser_worker_message;
+    worker.onerror = stop_eraser_worker;
+    return worker;
+}
+function stop_eraser_worker() {
+    if (!eraser_worker) return;
+    console.warn('AnkiPenDown: eraser worker failed, hit-testing on the main thread');
+    eraser_worker.terminate();
+    eraser_worker = null;
+    stroke_grid.clear();
+    strokes_by_id.forEach(function(stroke) {
+        grid_add(stroke_grid, stroke);
+    });
+    var pending = Array.from(erase_queries.values());
+    erase_queries.clear();
+    pending.forEach(function(query) {
+        query.callback(find_erased(stroke_grid, query.eraser, query.precise));
+    });
+}
+function post_points(message, points) {
+    message.data = points.data.slice(0, points.length * POINT_STRIDE);
+    message.length = points.length;
+    eraser_worker.postMessage(message, [message.data.buffer]);
+}
+function index_stroke(stroke) {
+    if (stroke.tool === 'eraser') return;
+    update_stroke_bbox(stroke);
+    stroke.id = stroke.id || next_stroke_id++;
+    strokes_by_id.set(stroke.id, stroke);
+    if (eraser_worker) {
+        post_points({type: 'add', id: stroke.id, visible: stroke.visible !== false}, stroke.points);
+    } else {
+        grid_add(stroke_grid, stroke);
+    }
+}
+function unindex_stroke(stroke) {
+    if (!strokes_by_id.has(stroke.id)) return;
+    strokes_by_id.delete(stroke.id);
+    if (eraser_worker) {
+        eraser_worker.postMessage({type: 'remove', id: stroke.id});
+    } else {
+        grid_remove(stroke_grid, stroke);
+    }
+}
+function index_stroke_visibility(stroke) {
+    if (eraser_worker && strokes_by_id.has(stroke.id)) {
+        eraser_worker.postMessage({type: 'visible', id: stroke.id, visible: stroke.visible !== false});
+    }
+}
+function clear_stroke_index() {
+    stroke_grid.clear();
+    strokes_by_id.clear();
+    erase_queries.clear();
+    if (eraser_worker) {
+        eraser_worker.postMessage({type: 'clear'});
+    }
+}
+function query_erased(eraserStroke, precise, callback) {
+    if (diagnostics) {
+        callback = timed_erase_callback(callback);
+    }
+    if (!eraser_worker) {
+        callback(find_erased(stroke_grid, eraserStroke, precise));
+        return null;
+    }
+    var query = next_erase_query++;
+    erase_queries.set(query, {eraser: eraserStroke, precise: precise, callback: callback});
+    post_points({type: 'query', query: query, width: eraserStroke.width, precise: precise}, eraserStroke.points);
+    return query;
+}
+function on_eraser_worker_message(e) {
+    var message = e.data;
+    var query = erase_queries.get(message.query);
+    if (!query) return;
+    erase_queries.delete(message.query);
+    var hits = new Map();
+    message.ids.forEach(function(id, k) {
+        var stroke = strokes_by_id.get(id);
+        if (stroke) {
+            hits.set(stroke, message.cuts ? message.cuts[k] : true);
+        }
+    });
+    query.callback(hits);
+}
+// Erasing happens live, while the eraser is dragged: every batch of new
+// samples is hit-tested on its own (overlapping the previous batch by one
+// sample, so the segment between them is tested too), against the strokes
+// still visible. One query is in flight at a time and the samples that arrive
+// meanwhile go into the next one, so a query never misses the children a cut
+// before it spliced in, and a slow worker is not flooded. Everything the drag
+// hides or cuts is recorded on the one eraser stroke, which stays a single
+// undo step. The answer may come back after more strokes were drawn, so it is
+// applied at wherever the eraser stroke is by then.
+function start_live_erase(eraserStroke) {
+    eraserStroke.erase_precise = precise_eraser;
+    eraserStroke.erasedIndices = [];
+    eraserStroke.splits = [];
+    eraserStroke.erase_upto = 0;
+    eraserStroke.erase_query = null;
+    eraserStroke.erase_incomplete = false;
+}
+function erase_live(eraserStroke) {
+    var count = eraserStroke.points.length;
+    if (eraserStroke.erase_query !== null || eraserStroke.erase_upto >= count) return;
+    var from = Math.max(0, eraserStroke.erase_upto - 1);
+    var batch = {width: eraserStroke.width, points: new_point_buffer(count - from)};
+    batch.points.data.set(eraserStroke.points.data.subarray(from * POINT_STRIDE, count * POINT_STRIDE));
+    batch.points.length = count - from;
+    eraserStroke.erase_upto = count;
+    eraserStroke.erase_query = query_erased(batch, eraserStroke.erase_precise, function(hits) {
+        eraserStroke.erase_query = null;
+        apply_erased(eraserStroke, hits);
+        erase_live(eraserStroke);
+    });
+}
+function apply_erased(eraserStroke, hits) {
+    var index = strokes_data.indexOf(eraserStroke);
+    if (index < 0 || hits.size === 0) return;
+    if (eraserStroke.erase_precise) {
+        cut_erased_strokes(eraserStroke, index, hits);
+    } else {
+        for (var i = 0; i < index; i++) {
+            if (hits.has(strokes_data[i]) && strokes_data[i].visible !== false) {
+                set_stroke_visible(i, false, 'erase');
+                eraserStroke.erasedIndices.push(i);
+            }
+        }
+    }
+    schedule_ink_save();
+}
+// Erases with the whole path of an eraser stroke again, for redoing one that
+// was undone before all of its answers arrived.
+function erase_with(eraserStroke) {
+    start_live_erase(eraserStroke);
+    erase_live(eraserStroke);
+}
+// Drops the answer still pending for an eraser stroke. What it already erased
+// is undone as usual; on redo the stroke erases from scratch.
+function cancel_erase(eraserStroke) {
+    if (eraserStroke.erase_query) {
+        erase_queries.delete(eraserStroke.erase_query);
+        eraserStroke.erase_query = null;
+        eraserStroke.erase_incomplete = true;
+    }
+}
+// The precise eraser cuts strokes instead of hiding them: what the eraser
+// left of a stroke (see find_erased) becomes child strokes spliced in place of
+// their parent, each ending on a point interpolated where the eraser's reach
+// crosses a segment. The eraser stroke records each split (index, parent,
+// children, touched rect) so undo and redo can swap parent and children back,
+// and only the touched rect is repainted.
+function cut_erased_strokes(eraserStroke, index, cuts) {
+    for (var i = index - 1; i >= 0; i--) {
+        var cut = cuts.get(strokes_data[i]);
+        if (cut && cut.spans.length && cut.length === strokes_data[i].points.length) {
+            var split = split_stroke(strokes_data[i], i, cut);
+            apply_split(split);
+            eraserStroke.splits.push(split);
+        }
+    }
+}
+// The erased spans of every segment of a cut, sorted and merged.
+function erased_spans_by_segment(cut) {
+    var by_segment = new Map();
+    for (var k = 0; k < cut.spans.length; k += 3) {
+        var segment = cut.spans[k];
+        if (!by_segment.has(segment)) by_segment.set(segment, []);
+        by_segment.get(segment).push([cut.spans[k + 1], cut.spans[k + 2]]);
+    }
+    by_segment.forEach(function(spans, segment) {
+        spans.sort(function(a, b) { return a[0] - b[0]; });
+        var merged = [spans[0]];
+        for (var k = 1; k < spans.length; k++) {
+            var last = merged[merged.length - 1];
+            if (spans[k][0] <= last[1]) {
+                last[1] = Math.max(last[1], spans[k][1]);
+            } else {
+                merged.push(spans[k]);
+            }
+        }
+        by_segment.set(segment, merged);
+    });
+    return by_segment;
+}
+function split_stroke(stroke, index, cut) {
+    var data = stroke.points.data;
+    var count = stroke.points.length;
+    var spans = erased_spans_by_segment(cut);
+    var children = [];
+    var run = null;
+    function push_at(i, t) {
+        var a = i * POINT_STRIDE, b = Math.min(i + 1, count - 1) * POINT_STRIDE;
+        push_point(run, data[a] + (data[b] - data[a]) * t, data[a + 1] + (data[b + 1] - data[a + 1]) * t,
+            data[a + 2] + (data[b + 2] - data[a + 2]) * t, data[a + 3] + (data[b + 3] - data[a + 3]) * t);
+    }
+    function end_run() {
+        if (run && run.length > 1) {
+            trim_point_buffer(run);
+            children.push({tool: stroke.tool, color: stroke.color, width: stroke.width,
+                opacity: stroke.opacity, visible: true, points: run});
+        }
+        run = null;
+    }
+    // A lone sample has no segment to keep part of; whatever touched it took it.
+    if (count > 1) {
+        for (var i = 0; i < count - 1; i++) {
+            var t = 0;
+            (spans.get(i) || []).forEach(function(span) {
+                if (span[0] > t) {
+                    if (!run) {
+                        run = new_point_buffer(8);
+                        push_at(i, t);
+                    }
+                    push_at(i, span[0]);
+                }
+                end_run();
+                t = Math.max(t, span[1]);
+            });
+            if (t < 1) {
+                if (!run) {
+                    run = new_point_buffer(8);
+                    push_at(i, t);
+                }
+                push_at(i, 1);
+            }
+        }
+        end_run();
+    }
+    // Child ends are drawn differently from the middle of the parent, so the
+    // rect also covers the two samples on either side of every cut.
+    var first_touched = count, last_touched = -1;
+    spans.forEach(function(_, segment) {
+        first_touched = Math.min(first_touched, segment);
+        last_touched = Math.max(last_touched, segment + 1);
+    });
+    var touched = {points: new_point_buffer(8)};
+    for (var j = Math.max(0, first_touched - 2); j <= Math.min(count - 1, last_touched + 2); j++) {
+        var o = j * POINT_STRIDE;
+        push_point(touched.points, data[o], data[o + 1], data[o + 2], data[o + 3]);
+    }
+    return {index: index, parent: stroke, children: children, rect: update_stroke_bbox(touched)};
+}
+function apply_split(split) {
+    strokes_data.splice.apply(strokes_data, [split.index, 1].concat(split.children));
+    unindex_stroke(split.parent);
+    forget_remote_path(split.parent);
+    split.children.forEach(index_stroke);
+    restructured_layer(split.parent.tool, split.index, split.children.length - 1, split.rect);
+}
+function revert_split(split) {
+    split.children.forEach(unindex_stroke);
+    split.children.forEach(forget_remote_path);
+    strokes_data.splice(split.index, split.children.length, split.parent);
+    index_stroke(split.parent);
+    restructured_layer(split.parent.tool, split.index, 1 - split.children.length, split.rect);
+}
+// The stroke at index was replaced and the ones after it moved by shift. On
+// its own layer whatever was rasterized with it is stale, though the pixels
+// only change inside rect; the other layers just renumber.
+function restructured_layer(tool, index, shift, rect) {
+    for (var other in layers) {
+        var layer = layers[other];
+        if (other === tool) {
+            drop_checkpoints(layer, index);
+            continue;
+        }
+        layer.checkpoints.forEach(function(checkpoint) {
+            if (checkpoint.upto > index) checkpoint.upto += shift;
+        });
+    }
+    invalidate_rect(tool, rect, 'erase');
+}
+var drawingWithPressurePenOnly = false;
+function pointerDownLine(e) {
+    wrapper.classList.add('nopointer');
+	if (!e.isPrimary) { return; }
+	if (e.pointerType[0] == 'p') { drawingWithPressurePenOnly = true }
+	else if ( drawingWithPressurePenOnly) { return; }
+    if(!isPointerDown){
+        event.preventDefault();
+        note_input_time(e);
+        redo_stack = [];
+        ts_redo_button.className = "";
+        let stroke_color, stroke_width, stroke_opacity;
+        let point_width = line_width;
+        if (current_tool === 'pen') {
+            stroke_color = color;
+            stroke_width = line_width;
+            stroke_opacity = 1.0;
+            point_width = e.pointerType[0] == 'p' ? (1.0 + e.pressure * line_width * 2) : line_width
+        } else if (current_tool === 'highlighter') {
+            stroke_color = '#FFFF00';
+            stroke_width = 20;
+            stroke_opacity = 0.4;
+            point_width = stroke_width;
+        } else { // eraser
+            stroke_color = 'rgba(0,0,0,1)';
+            stroke_width = 20;
+            stroke_opacity = 1.0;
+            point_width = stroke_width;
+        }
+        var points = new_point_buffer();
+        push_point(points,
+            sample_x(e, null),
+            sample_y(e, null),
+            e.pointerType[0] == 'p' ? e.pressure : 2,
+            point_width);
+        strokes_data.push({
+            tool: current_tool,
+            color: stroke_color,
+            width: stroke_width,
+            opacity: stroke_opacity,
+            visible: true,
+            points: points
+        });
+        live_stroke = strokes_data[strokes_data.length-1];
+        live_next_point = 0;
+        live_canvas.style.opacity = stroke_opacity;
+        if (current_tool === 'eraser') {
+            start_live_erase(live_stroke);
+            erase_live(live_stroke);
+        }
+        start_drawing();
+    }
+}
+// With coalesced_input on, every sample the browser merged into a pointermove
+// is recorded, and the predicted samples are kept aside to draw a provisional
+// tip that is wiped again on the next frame.
+var predicted_points = new_point_buffer(8);
+function pointer_samples(e) {
+    if (coalesced_input && e.getCoalescedEvents) {
+        var samples = e.getCoalescedEvents();
+        if (samples.length) return samples;
+    }
+    return [e];
+}
+function sample_x(sample, rect) {
+    return (rect ? sample.clientX - rect.left - (pen_canvas.clientLeft || 0) : sample.offsetX);
+}
+function sample_y(sample, rect) {
+    return (rect ? sample.clientY - rect.top - (pen_canvas.clientTop || 0) : sample.offsetY) + canvas_origin_y;
+}
+function pointerMoveLine(e) {
+	if (!e.isPrimary) { return; }
+	if (e.pointerType[0] != 'p' && drawingWithPressurePenOnly) { return; }
+    if (isPointerDown) {
+        let last_stroke = strokes_data[strokes_data.length-1];
+        let samples = pointer_samples(e);
+        let rect = (samples[0] !== e) ? pen_canvas.getBoundingClientRect() : null;
+        note_input_time(samples[0]);
+        samples.forEach(function(sample) {
+            let point_width = (last_stroke.tool === 'pen')
+                ? (sample.pointerType[0] == 'p' ? (1.0 + sample.pressure * line_width * 2) : line_width)
+                : last_stroke.width;
+            push_point(last_stroke.points,
+                sample_x(sample, rect),
+                sample_y(sample, rect),
+                sample.pointerType[0] == 'p' ? sample.pressure : 2,
+                point_width);
+        });
+        predicted_points.length = 0;
+        if (coalesced_input && e.getPredictedEvents) {
+            rect = rect || pen_canvas.getBoundingClientRect();
+            let last_width = last_stroke.points.data[(last_stroke.points.length - 1) * POINT_STRIDE + 3];
+            e.getPredictedEvents().forEach(function(sample) {
+                push_point(predicted_points, sample_x(sample, rect), sample_y(sample, rect), 0, last_width);
+            });
+        }
+        if (last_stroke.tool === 'eraser') {
+            erase_live(last_stroke);
+        }
+        request_frame('pointer');
+    }
+}
+function pointerUpLine(e) {
+    wrapper.classList.remove('nopointer');
+	if (!e.isPrimary) { return; }
+	if (e.pointerType[0] != 'p' && drawingWithPressurePenOnly) { return; }
+    if (isPointerDown) {
+        let last_stroke = strokes_data[strokes_data.length-1];
+        let point_width = (last_stroke.tool === 'pen')
+            ? (e.pointerType[0] == 'p' ? (1.0 + e.pressure * line_width * 2) : line_width)
+            : last_stroke.width;
+        push_point(last_stroke.points,
+            sample_x(e, null),
+            sample_y(e, null),
+            e.pointerType[0] == 'p' ? e.pressure : 2,
+            point_width);
+    }
+	stop_drawing();
+}
+document.addEventListener('keyup', function(e) {
+    if ((e.keyCode == 90 || e.keyCode == 122) && e.altKey) {
+		e.preventDefault();
+        ts_undo();
+    }
+    if ((e.keyCode == 89 || e.keyCode == 121) && e.altKey) {
+        e.preventDefault();
+        ts_redo();
+    }
+    if (e.key === ".") {
+        clear_canvas();
+    }
+	if (e.key === ",") {
+        switch_visibility();
+    }
+    if ((e.key === "b" || e.key === "B") && e.altKey) {
+        e.preventDefault();
+        switch_small_canvas();
+    }
+})
+set_diagnostics(diagnostics);
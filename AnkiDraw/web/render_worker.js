@@ -0,0 +1,71 @@
+/*
+ * AnkiPenDown render worker.
+ *
+ * Owns the pen and highlighter canvases once the page has transferred them
+ * (see offscreen_rendering in pendown.js), plus the OffscreenCanvases the page
+ * asks for as layer checkpoints and scratch space. The page posts the canvas
+ * calls it recorded as flat (canvas id, op, argument) triples and this replays
+ * them in order; committed strokes arrive as points and are turned into the
+ * same Path2D outline the page would fill.
+ */
+// The page loads this worker with the cache-busting query of its own
+// scripts; geometry.js is fetched with the same one.
+importScripts('geometry.js' + self.location.search);
+
+var contexts = new Map();
+var paths = new Map();
+var PROPERTIES = new Set(['globalAlpha', 'globalCompositeOperation', 'fillStyle', 'lineJoin']);
+
+function run(canvas_id, op, arg) {
+    var ctx = contexts.get(canvas_id);
+    switch (op) {
+    case 'create':
+        contexts.set(canvas_id, new OffscreenCanvas(1, 1).getContext('2d'));
+        break;
+    case 'release':
+        contexts.delete(canvas_id);
+        break;
+    case 'width':
+    case 'height':
+        ctx.canvas[op] = arg;
+        break;
+    case 'path':
+        paths.set(arg.id, build_stroke_path({tool: arg.tool, points: {data: arg.data, length: arg.length}}));
+        break;
+    case 'forget_path':
+        paths.delete(arg);
+        break;
+    case 'forget_paths':
+        paths.clear();
+        break;
+    case 'fill':
+        ctx.fill(paths.get(arg));
+        break;
+    case 'drawImage':
+        ctx.drawImage(contexts.get(arg[0]).canvas, arg[1], arg[2]);
+        break;
+    default:
+        if (PROPERTIES.has(op)) {
+            ctx[op] = arg;
+        } else {
+            ctx[op].apply(ctx, arg || []);
+        }
+    }
+}
+
+onmessage = function(e) {
+    var message = e.data;
+    switch (message.type) {
+    case 'init':
+        for (var canvas_id in message.canvases) {
+            contexts.set(canvas_id, message.canvases[canvas_id].getContext('2d'));
+        }
+        break;
+    case 'draw':
+        var commands = message.commands;
+        for (var i = 0; i < commands.length; i += 3) {
+            run(commands[i], commands[i + 1], commands[i + 2]);
+        }
+        break;
+    }
+};
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# Copyright: Vijay <http://t.me/Viiijay1>
+# License: GNU GPL, version 3 or later; http://www.gnu.org/copyleft/gpl.html
+"""
+Round-trip check and benchmark of the drawing codec (AnkiDraw/ink_codec.py).
+
+Runs headless, without Anki: synthetic drawings are encoded and decoded, every
+point must come back within the quantization step, and re-encoding a decoded
+drawing must give the same bytes. The size against the JSON the drawings used
+to be saved as and the encode/decode throughput are reported. If node is on
+the PATH, web/ink_codec.js must encode every drawing to the same bytes.
+
+    python benchmarks/bench_ink_codec.py [--quick]
+
+The exit status is 1 if any check fails.
+"""
+import argparse
+import array
+import base64
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+import zlib
+
+WEB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "AnkiDraw", "web")
+sys.path.insert(0, os.path.join(WEB_DIR, os.pardir))
+
+import ink_codec  # noqa: E402
+
+REPEATS = 3
+WORKLOADS = {
+    "full": ((10, 50), (200, 100), (2000, 100), (200, 1000)),
+    "quick": ((10, 50), (200, 100)),
+}
+COLORS = ("#000000", "#ff0000", "#0000ff", "#FFFF0066")
+
+# Encodes the drawings given as JSON on stdin with web/ink_codec.js and prints
+# the results as base64, one per line.
+NODE_SCRIPT = """
+const fs = require('fs'), vm = require('vm'), path = require('path');
+const context = {Float32Array, Uint8Array, Map, Math, TextEncoder, TextDecoder, String, Error, btoa, atob};
+vm.createContext(context);
+vm.runInContext('var POINT_STRIDE = 4;', context);
+vm.runInContext(fs.readFileSync(path.join(process.argv[1], 'ink_codec.js'), 'utf8'), context);
+const drawings = JSON.parse(fs.readFileSync(0, 'utf8'));
+for (const strokes of drawings) {
+    const page = strokes.map(s => Object.assign({}, s,
+        {points: {data: new Float32Array(s.points), length: s.points.length / 4}}));
+    console.log(context.bytes_to_base64(context.encode_drawing(page)));
+}
+"""
+
+
+def make_drawing(strokes, points, seed=1):
+    """
+    Pen and highlighter strokes as the page holds them: the coordinates are
+    float32, like its point buffers, so both codecs see the same values.
+    """
+    rng = random.Random(seed)
+    drawing = []
+    for _ in range(strokes):
+        tool = rng.choice(("pen", "pen", "highlighter"))
+        width = 20 if tool == "highlighter" else rng.choice((2, 4, 6))
+        pressure = rng.random() < 0.5
+        x, y = rng.uniform(0, 1200), rng.uniform(0, 4000)
+        heading = rng.uniform(0, 2 * math.pi)
+        flat = []
+        for _ in range(points):
+            heading += rng.uniform(-0.4, 0.4)
+            x += math.cos(heading) * 3
+            y += math.sin(heading) * 3
+            p = rng.uniform(0.2, 1) if pressure else 2
+            flat += [x, y, p, width * p if pressure else width]
+        drawing.append({"tool": tool, "color": rng.choice(COLORS), "width": width,
+                        "opacity": 0.4 if tool == "highlighter" else 1, "visible": True,
+                        "points": array.array("f", flat).tolist()})
+    return drawing
+
+
+def best_time(function, repeats=REPEATS):
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def check_round_trip(drawing, data):
+    """
+    Return a description of what did not survive encoding, or None.
+    """
+    decoded = ink_codec.decode_drawing(data)
+    if len(decoded) != len(drawing):
+        return "%d strokes decoded, %d encoded" % (len(decoded), len(drawing))
+    step = 0.5 / ink_codec.SCALE + 1e-6
+    for index, (before, after) in enumerate(zip(drawing, decoded)):
+        for key in ("tool", "color", "visible"):
+            if before[key] != after[key]:
+                return "stroke %d: %s %r became %r" % (index, key, before[key], after[key])
+        if len(before["points"]) != len(after["points"]):
+            return "stroke %d: point count changed" % index
+        for i, (a, b) in enumerate(zip(before["points"], after["points"])):
+            tolerance = 0.005 + 1e-6 if i % ink_codec.POINT_STRIDE == 2 else step
+            if abs(a - b) > tolerance:
+                return "stroke %d: value %d is %r, was %r" % (index, i, b, a)
+    if ink_codec.encode_drawing(decoded) != data:
+        return "re-encoding the decoded drawing changed its bytes"
+    return None
+
+
+def node_encodings(drawings):
+    node = shutil.which("node")
+    if node is None:
+        return None
+    result = subprocess.run([node, "-e", NODE_SCRIPT, WEB_DIR], input=json.dumps(drawings),
+                            capture_output=True, text=True, check=True)
+    return [base64.b64decode(line) for line in result.stdout.split()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="run the small workloads only")
+    args = parser.parse_args(argv)
+
+    failures = []
+    drawings = []
+    encodings = []
+    print("%-12s %10s %10s %10s %7s %12s %12s" % (
+        "drawing", "json", "json+zlib", "binary", "ratio", "encode pt/s", "decode pt/s"))
+    for strokes, points in WORKLOADS["quick" if args.quick else "full"]:
+        name = "%dx%d" % (strokes, points)
+        drawing = make_drawing(strokes, points)
+        text = json.dumps(drawing, separators=(",", ":"))
+        encode_time, data = best_time(lambda: ink_codec.encode_drawing(drawing))
+        decode_time, _ = best_time(lambda: ink_codec.decode_drawing(data))
+        problem = check_round_trip(drawing, data)
+        if problem:
+            failures.append("%s: %s" % (name, problem))
+        drawings.append(drawing)
+        encodings.append(data)
+        total = strokes * points
+        print("%-12s %10d %10d %10d %6.1fx %12.0f %12.0f" % (
+            name, len(text), len(zlib.compress(text.encode("utf-8"), 6)), len(data),
+            len(text) / len(data), total / encode_time, total / decode_time))
+    empty = ink_codec.encode_drawing([])
+    if ink_codec.decode_drawing(empty) != [] or ink_codec.stroke_count(empty) != 0:
+        failures.append("the empty drawing does not round-trip")
+    from_node = node_encodings(drawings)
+    if from_node is None:
+        print("node is not installed, web/ink_codec.js was not compared.")
+    else:
+        for drawing, data, js_data in zip(drawings, encodings, from_node):
+            if data != js_data:
+                failures.append("%dx%d: ink_codec.js encoded other bytes than ink_codec.py" % (
+                    len(drawing), len(drawing[0]["points"]) // ink_codec.POINT_STRIDE))
+    for line in failures:
+        print("FAIL " + line)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
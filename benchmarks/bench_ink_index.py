@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Copyright: Vijay <http://t.me/Viiijay1>
+# License: GNU GPL, version 3 or later; http://www.gnu.org/copyleft/gpl.html
+"""
+Benchmark of the drawing index behind the Browser's ink: searches
+(AnkiDraw/ink_store.py).
+
+Runs headless, without Anki: a drawing store with the given number of
+annotated cards is built in a temporary folder, then every comparison is
+searched and timed, and the ids found are checked against the stroke counts
+the cards were given. A few drawings are still queued while searching, over
+saved rows with other stroke counts, so their counts have to come from
+memory.
+
+    python benchmarks/bench_ink_index.py [--cards 100000]
+
+The exit status is 1 if a search returns the wrong cards.
+"""
+import argparse
+import operator
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "AnkiDraw")
+
+# ink_store imports its codec relatively; load both as a package without
+# running the add-on's __init__, which needs Anki.
+package = types.ModuleType("pendown")
+package.__path__ = [PACKAGE_DIR]
+sys.modules["pendown"] = package
+
+from pendown import ink_codec, ink_store  # noqa: E402
+
+REPEATS = 5
+QUEUED = 100
+OPERATORS = {"<": operator.lt, "<=": operator.le, "=": operator.eq, ">": operator.gt, ">=": operator.ge}
+SEARCHES = (("ink:yes", ">", 0), ("ink:5", "=", 5), ("ink:<10", "<", 10), ("ink:>50", ">", 50),
+            ("ink:>=90", ">=", 90))
+
+
+def make_drawing(strokes):
+    points = [0.0, 0.0, 0.5, 4.0, 8.0, 8.0, 0.5, 4.0]
+    return ink_codec.encode_drawing([{"tool": "pen", "color": "#000000", "width": 4, "opacity": 1,
+                                      "visible": True, "points": points}] * strokes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cards", type=int, default=100000, help="annotated cards (default 100000)")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    counts = {card_id: rng.randint(1, 100) for card_id in range(1, args.cards + 1)}
+    drawings = {count: make_drawing(count) for count in range(1, 101)}
+    failures = []
+    with tempfile.TemporaryDirectory() as folder:
+        store = ink_store.InkStore(os.path.join(folder, "ankipendown.db"))
+        # Drawings of the same size share their row values, so the rows are
+        # written directly; the last few cards are saved again and stay
+        # queued.
+        rows = {count: (ink_store.encode_drawing(data),) + ink_store.index_values(data)
+                for count, data in drawings.items()}
+        queued = set(list(counts)[-QUEUED:])
+        with store._reader:
+            store._reader.executemany(
+                "INSERT INTO drawings (cid, mtime, data, strokes, min_x, min_y, max_x, max_y)"
+                " VALUES (?, 0, ?, ?, ?, ?, ?, ?)",
+                ((card_id,) + rows[count % 100 + 1 if card_id in queued else count]
+                 for card_id, count in counts.items()))
+        for card_id in queued:
+            store.save(card_id, drawings[counts[card_id]])
+        print("%-10s %10s %10s" % ("search", "cards", "ms"))
+        for name, comparison, count in SEARCHES:
+            best = None
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                text = store.search(comparison, count)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            found = {int(card_id) for card_id in text.split(",")} if text else set()
+            expected = {card_id for card_id, strokes in counts.items()
+                        if OPERATORS[comparison](strokes, count)}
+            if found != expected:
+                failures.append("%s found %d cards, expected %d" % (name, len(found), len(expected)))
+            print("%-10s %10d %10.2f" % (name, len(found), best * 1000))
+        store.close()
+    for line in failures:
+        print("FAIL " + line)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
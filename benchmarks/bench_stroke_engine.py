@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Copyright: Vijay <http://t.me/Viiijay1>
+# License: GNU GPL, version 3 or later; http://www.gnu.org/copyleft/gpl.html
+"""
+Benchmark of the reference stroke engine (AnkiDraw/stroke_engine.py).
+
+Runs headless, without Anki: synthetic drawings of strokes x points are
+built, erased with eraser strokes of a given length and undone/redone, for
+every hit-testing backend available, and the throughput of each phase is
+reported. Both backends must erase the same strokes.
+
+    python benchmarks/bench_stroke_engine.py [--quick] [--save results.json]
+        [--baseline results.json] [--threshold 0.2]
+
+With --baseline, a phase that got slower than the baseline by more than the
+threshold is reported as a regression and the exit status is 1.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "AnkiDraw"))
+
+import stroke_engine  # noqa: E402
+
+CANVAS_SIZE = 1200
+ERASERS_PER_RUN = 10
+REPEATS = 3
+WORKLOADS = {
+    "full": {"strokes": (200, 2000), "points": (20, 100), "eraser": (10, 100)},
+    "quick": {"strokes": (100, 500), "points": (20,), "eraser": (10, 50)},
+}
+
+
+def random_walk(rng, count, step, width):
+    x, y = rng.uniform(0, CANVAS_SIZE), rng.uniform(0, CANVAS_SIZE)
+    heading = rng.uniform(0, 2 * math.pi)
+    points = []
+    for _ in range(count):
+        heading += rng.uniform(-0.4, 0.4)
+        x += math.cos(heading) * step
+        y += math.sin(heading) * step
+        points.append((x, y, 0.5, width))
+    return points
+
+
+def make_workload(strokes, points, eraser, seed=1):
+    rng = random.Random(seed)
+    drawing = [random_walk(rng, points, 3, rng.choice((2, 4, 6))) for _ in range(strokes)]
+    erasers = [random_walk(rng, eraser, 6, stroke_engine.ERASER_WIDTH) for _ in range(ERASERS_PER_RUN)]
+    return drawing, erasers
+
+
+def best_time(function, repeats=REPEATS):
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_workload(backend, drawing, erasers):
+    """
+    Time one backend on one workload. Returns the phase timings (seconds)
+    and the erased indices of every eraser, for the cross-backend check.
+    """
+    def build():
+        engine = stroke_engine.StrokeEngine(backend)
+        for points in drawing:
+            engine.begin_stroke("pen", width=points[0][3])
+            for point in points:
+                engine.add_point(*point)
+            engine.end_stroke()
+        return engine
+
+    build_time, engine = best_time(build)
+
+    def erase():
+        erased = []
+        for points in erasers:
+            eraser = engine.add_stroke("eraser", points)
+            erased.append(list(eraser.erased_indices))
+            engine.undo()
+        return erased
+
+    erase_time, erased = best_time(erase)
+
+    def undo_redo():
+        steps = 0
+        while engine.undo():
+            steps += 1
+        while engine.redo():
+            pass
+        return steps
+
+    undo_redo_time, steps = best_time(undo_redo)
+    return {
+        "build": build_time,
+        "erase": erase_time,
+        "undo_redo": undo_redo_time,
+    }, {
+        "build": sum(len(points) for points in drawing) / build_time,
+        "erase": len(erasers) / erase_time,
+        "undo_redo": 2 * steps / undo_redo_time,
+    }, erased
+
+
+def available_backends():
+    return [backend for backend in stroke_engine.BACKENDS
+            if backend != "numpy" or stroke_engine.np is not None]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="run the small workloads only")
+    parser.add_argument("--save", metavar="FILE", help="write the timings as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against timings saved earlier")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown against the baseline reported as a regression (default 0.2)")
+    args = parser.parse_args(argv)
+
+    sizes = WORKLOADS["quick" if args.quick else "full"]
+    backends = available_backends()
+    if "numpy" not in backends:
+        print("NumPy is not installed, benchmarking the grid backend only.")
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    results = {}
+    regressions = []
+    mismatches = []
+    print("%-28s %-6s %14s %14s %14s" % ("workload", "backend", "points/s", "erases/s", "undo+redo/s"))
+    for strokes, points, eraser in itertools.product(sizes["strokes"], sizes["points"], sizes["eraser"]):
+        name = "%dx%d eraser %d" % (strokes, points, eraser)
+        drawing, erasers = make_workload(strokes, points, eraser)
+        reference = None
+        for backend in backends:
+            timings, rates, erased = run_workload(backend, drawing, erasers)
+            if reference is None:
+                reference = erased
+            elif erased != reference:
+                mismatches.append("%s: %s erased other strokes than %s" % (name, backend, backends[0]))
+            key = "%s/%s" % (name, backend)
+            results[key] = timings
+            print("%-28s %-6s %14.0f %14.1f %14.0f" % (name, backend, rates["build"], rates["erase"],
+                                                      rates["undo_redo"]))
+            for phase, seconds in timings.items():
+                before = baseline.get(key, {}).get(phase)
+                if before and seconds > before * (1 + args.threshold):
+                    regressions.append("%s %s: %.2f ms -> %.2f ms (+%.0f%%)" % (
+                        key, phase, before * 1000, seconds * 1000, (seconds / before - 1) * 100))
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=1, sort_keys=True)
+    for line in mismatches:
+        print("MISMATCH " + line)
+    for line in regressions:
+        print("REGRESSION " + line)
+    return 1 if mismatches or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())